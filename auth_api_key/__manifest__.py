@@ -5,10 +5,16 @@
     "name": "Auth Api Key",
     "summary": """
         Authenticate http requests from an API key""",
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.3.0",
     "license": "LGPL-3",
     "author": "ACSONE SA/NV,Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/server-auth",
     "development_status": "Beta",
-    "data": ["security/ir.model.access.csv", "views/auth_api_key.xml"],
+    "external_dependencies": {"python": ["redis"]},
+    "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
+        "views/auth_api_key.xml",
+        "wizards/auth_api_key_provision_wizard.xml",
+    ],
 }
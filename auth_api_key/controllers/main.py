@@ -0,0 +1,84 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import csv
+import io
+import json
+
+from werkzeug.exceptions import BadRequest, Forbidden
+
+from odoo import api
+from odoo.http import Controller, Response, request, route
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
+class AuthApiKeyController(Controller):
+    @route("/auth_api_key/provision", type="json", auth="user", methods=["POST"])
+    def provision(self, keys):
+        """Create api keys from a list of {name, user} objects or from a CSV
+        document, and return their generated keys.
+
+        The keys are only returned by this call, they can not be exported.
+        """
+        AuthApiKey = request.env["auth.api.key"]
+        rows = AuthApiKey._parse_provision_data(keys) if isinstance(keys, str) else keys
+        return [
+            {"id": api_key.id, "name": api_key.name, "key": api_key.key}
+            for api_key in AuthApiKey._provision(rows)
+        ]
+
+    @route("/auth_api_key/export", type="http", auth="user", methods=["GET"])
+    def export(self, export_format="csv"):
+        """Stream the metadata of all api keys, without the keys."""
+        if export_format not in EXPORT_CONTENT_TYPES:
+            raise BadRequest()
+        if not request.env["auth.api.key"].check_access_rights(
+            "read", raise_exception=False
+        ):
+            raise Forbidden()
+        return Response(
+            self._stream_export(request.env, export_format),
+            headers=[
+                ("Content-Type", EXPORT_CONTENT_TYPES[export_format]),
+                (
+                    "Content-Disposition",
+                    f"attachment; filename=auth_api_keys.{export_format}",
+                ),
+            ],
+            direct_passthrough=True,
+        )
+
+    def _stream_export(self, env, export_format):
+        # the response is sent after the request cursor is closed
+        with env.registry.cursor() as cr:
+            env = api.Environment(cr, env.uid, env.context)
+            AuthApiKey = env["auth.api.key"].with_context(active_test=False)
+            export_fields = AuthApiKey._get_export_fields()
+            if export_format == "csv":
+                yield self._format_csv_rows([export_fields])
+            last_id = 0
+            while True:
+                api_keys = AuthApiKey.search(
+                    [("id", ">", last_id)], order="id", limit=EXPORT_BATCH_SIZE
+                )
+                if not api_keys:
+                    break
+                rows = [api_key._get_export_values() for api_key in api_keys]
+                if export_format == "csv":
+                    yield self._format_csv_rows(
+                        [[row[name] for name in export_fields] for row in rows]
+                    )
+                else:
+                    yield "".join(json.dumps(row) + "\n" for row in rows)
+                last_id = api_keys[-1].id
+                env.invalidate_all()
+
+    def _format_csv_rows(self, rows):
+        output = io.StringIO()
+        csv.writer(output).writerows(rows)
+        return output.getvalue()
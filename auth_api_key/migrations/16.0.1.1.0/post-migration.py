@@ -0,0 +1,24 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+import psycopg2
+
+from odoo import SUPERUSER_ID, api
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    for api_key in env["auth.api.key"].search([]):
+        try:
+            with cr.savepoint():
+                api_key._update_key_digest()
+        except psycopg2.IntegrityError:
+            _logger.warning(
+                "Api key %s has the same key as another api key, it can not be "
+                "used before its key is changed.",
+                api_key.name,
+            )
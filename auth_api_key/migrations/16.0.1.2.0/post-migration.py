@@ -0,0 +1,13 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    # the digests were keyed with database.secret, which changes when the
+    # database is duplicated, compute them again without it
+    api_keys = env["auth.api.key"].with_context(active_test=False).search([])
+    api_keys.write({"key_digest": False})
+    api_keys._update_key_digest()
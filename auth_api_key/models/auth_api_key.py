@@ -1,9 +1,45 @@
 # Copyright 2018 ACSONE SA/NV
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
-from odoo import _, api, fields, models, tools
-from odoo.exceptions import AccessError, ValidationError
-from odoo.tools import consteq
+import csv
+import hashlib
+import io
+import json
+import logging
+import secrets
+import time
+from datetime import timedelta
+from functools import partial
+
+from odoo import SUPERUSER_ID, _, api, fields, models, tools
+from odoo.exceptions import AccessError, UserError, ValidationError
+from odoo.modules.registry import Registry
+from odoo.tools import config, consteq
+
+from ..rate_limit import get_rate_limit_backend
+from ..signature import MAX_NONCE_LENGTH, get_replay_cache, sign
+from ..throttle import ExpiringSet, KeyCache, TokenBucket, get_store
+from ..usage import get_usage_recorder
+
+_logger = logging.getLogger(__name__)
+
+
+def flush_usage(dbname):
+    """Write the usage of the api keys recorded by the worker for dbname."""
+    registry = Registry.registries.get(dbname)
+    if registry is None or registry.in_test_mode():
+        # tests write the usage themselves, in their own transaction
+        return
+    recorder = get_usage_recorder(dbname)
+    usage = recorder.pop()
+    if not usage:
+        return
+    try:
+        with registry.cursor() as cr:
+            api.Environment(cr, SUPERUSER_ID, {})["auth.api.key"]._write_usage(usage)
+    except Exception:
+        _logger.exception("Could not write the usage of api keys")
+        recorder.restore(usage)
 
 
 class AuthApiKey(models.Model):
@@ -23,41 +59,600 @@ class AuthApiKey(models.Model):
         help="""The user used to process the requests authenticated by
         the api key""",
     )
+    active = fields.Boolean(default=True)
+    expires_at = fields.Datetime(
+        copy=False, help="The key is not accepted anymore after this date."
+    )
+    rotated_from_id = fields.Many2one(
+        comodel_name="auth.api.key",
+        string="Rotated From",
+        readonly=True,
+        copy=False,
+        help="The key this key replaces.",
+    )
+    key_digest = fields.Char(
+        readonly=True,
+        copy=False,
+        help="SHA-256 digest of the API key, under which it is looked up.",
+    )
+    rate_limit = fields.Float(
+        help="Requests per second allowed with the key, 0 for no limit."
+    )
+    rate_limit_burst = fields.Integer(
+        string="Rate Limit Burst",
+        help="Requests that can be sent at once with the key, before being "
+        "limited to the rate limit. Defaults to the rate limit.",
+    )
+    last_used = fields.Datetime(readonly=True, copy=False)
+    usage_count = fields.Integer(
+        readonly=True, copy=False, help="Number of requests authenticated by the key."
+    )
+    last_ip = fields.Char(
+        string="Last IP", readonly=True, copy=False, help="Address of the last request."
+    )
 
-    _sql_constraints = [("name_uniq", "unique(name)", "Api Key name must be unique.")]
+    _sql_constraints = [
+        ("name_uniq", "unique(name)", "Api Key name must be unique."),
+        ("key_digest_uniq", "unique(key_digest)", "Api Key must be unique."),
+    ]
 
     @api.model
     def _retrieve_api_key(self, key):
         return self.browse(self._retrieve_api_key_id(key))
 
     @api.model
-    @tools.ormcache("key")
     def _retrieve_api_key_id(self, key):
+        return self._retrieve_api_key_info(key)[0]
+
+    @api.model
+    def _retrieve_uid_from_api_key(self, key):
+        return self._retrieve_api_key_info(key)[1]
+
+    @api.model
+    def _retrieve_api_key_info(self, key):
+        """Return (api key id, user id, group codes) of key."""
+        if not self.env.user.has_group("base.group_system"):
+            raise AccessError(_("User is not allowed"))
+        digest = self._get_key_digest(key)
+        expires_at, info = self._get_key_entry(digest, key)
+        if expires_at and expires_at <= fields.Datetime.now():
+            raise ValidationError(_("The key %s is expired") % key)
+        return info
+
+    @api.model
+    def _retrieve_api_key_info_from_signature(
+        self, api_key_id, timestamp, nonce, signature, message
+    ):
+        """Return (api key id, user id, group codes) of the key api_key_id, if
+        signature is the signature of message with the key, sent at timestamp.
+
+        The key is looked up by id, and a nonce is accepted only once per key.
+        """
         if not self.env.user.has_group("base.group_system"):
             raise AccessError(_("User is not allowed"))
-        for api_key in self.search([]):
-            if api_key.key and consteq(key, api_key.key):
-                return api_key.id
+        try:
+            api_key_id = int(api_key_id)
+            timestamp = int(timestamp)
+        except ValueError as e:
+            raise ValidationError(_("Malformed signed request")) from e
+        if not nonce or len(nonce) > MAX_NONCE_LENGTH:
+            raise ValidationError(_("Malformed signed request"))
+        max_age = self._get_signature_max_age()
+        if abs(time.time() - timestamp) > max_age:
+            raise ValidationError(
+                _("The timestamp of the signed request is out of the allowed window")
+            )
+        signing_key, expires_at, info = self._get_signing_key_entry(api_key_id)
+        if expires_at and expires_at <= fields.Datetime.now():
+            raise ValidationError(_("The key %s is expired") % api_key_id)
+        if not consteq(sign(signing_key, message).encode(), signature.encode()):
+            raise ValidationError(_("Invalid signature for the key %s") % api_key_id)
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        replay_cache = get_replay_cache(
+            self.env.cr.dbname,
+            int(get_param("auth_api_key.signature_cache_size", 10000)),
+            # timestamps are accepted up to max_age in the past and the future
+            2 * max_age,
+        )
+        if not replay_cache.add((api_key_id, nonce)):
+            raise ValidationError(_("The signed request was already received"))
+        return info
+
+    @api.model
+    def _get_signature_max_age(self):
+        return float(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("auth_api_key.signature_max_age", 300)
+        )
+
+    def _get_signing_key(self):
+        """Return the key to check the signatures of the requests with."""
+        self.ensure_one()
+        return self.key
+
+    @api.model
+    def _get_signing_key_entry(self, api_key_id):
+        """Return the (signing key, expires_at, info) of the valid key api_key_id.
+
+        It is cached like the entries of the keys by digest.
+        """
+        cache = self._get_key_cache()
+        generation = cache.generation
+        self._refresh_key_cache()
+        entry = cache.get(("signing", api_key_id))
+        if entry is None:
+            api_key = self.browse(api_key_id).exists()
+            signing_key = api_key.active and api_key._get_signing_key()
+            if not signing_key:
+                raise ValidationError(_("The key %s is not allowed") % api_key_id)
+            entry = (
+                signing_key.encode(),
+                api_key.expires_at,
+                api_key._get_api_key_info(),
+            )
+            cache.put(("signing", api_key_id), api_key_id, entry, generation)
+        return entry
+
+    @api.model
+    def _lookup_api_key(self, key, digest):
+        api_key = self._search_api_key_by_digest(digest)
+        if api_key.key and consteq(key, api_key.key):
+            return api_key
+        self._get_invalid_key_cache().add(digest)
         raise ValidationError(_("The key %s is not allowed") % key)
 
     @api.model
-    @tools.ormcache("key")
-    def _retrieve_uid_from_api_key(self, key):
-        return self._retrieve_api_key(key).user_id.id
+    def _get_key_entry(self, digest, key):
+        """Return the (expires_at, info) of the valid key key, of digest."""
+        if digest in self._get_invalid_key_cache():
+            raise ValidationError(_("The key %s is not allowed") % key)
+        cache = self._get_key_cache()
+        generation = cache.generation
+        self._refresh_key_cache()
+        entry = cache.get(("digest", digest))
+        if entry is None:
+            api_key = self._lookup_api_key(key, digest)
+            entry = api_key.expires_at, api_key._get_api_key_info()
+            cache.put(("digest", digest), api_key.id, entry, generation)
+        return entry
+
+    @api.model
+    def _get_key_cache(self):
+        """Return the cache of the valid keys of this worker.
+
+        It holds at most auth_api_key.key_cache_size entries, each kept for
+        auth_api_key.key_cache_ttl seconds. It is kept in the memory of the
+        worker, outside of the registry cache: the entries of a changed key
+        are dropped from it through the invalidations of the key cache, see
+        _refresh_key_cache().
+        """
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return get_store(
+            self.env.cr.dbname,
+            "valid_keys",
+            KeyCache,
+            int(get_param("auth_api_key.key_cache_size", 10000)),
+            float(get_param("auth_api_key.key_cache_ttl", 60)),
+        )
+
+    @api.model
+    def _refresh_key_cache(self):
+        """Drop the entries of the keys changed by other transactions from
+        the cache of the valid keys of this worker, in a single query.
+
+        Only the invalidations of the transactions that were still running
+        when the cache was last refreshed are read.
+        """
+        cache = self._get_key_cache()
+        self.env.cr.execute(
+            """
+            SELECT txid_snapshot_xmin(txid_current_snapshot()),
+                ARRAY(
+                    SELECT ARRAY[xid, api_key_id]
+                    FROM auth_api_key_cache_invalidation
+                    WHERE xid >= %s
+                )
+            """,
+            [cache.xmin],
+        )
+        xmin, invalidations = self.env.cr.fetchone()
+        cache.apply_invalidations(xmin, map(tuple, invalidations))
+        return cache
+
+    @api.model
+    def _get_invalid_key_cache(self):
+        """Return the set of the digests of the keys recently found invalid.
+
+        It is kept in the memory of the worker, outside of the registry cache:
+        the other workers accept a key that became valid after at most
+        auth_api_key.invalid_key_cache_ttl seconds.
+        """
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return get_store(
+            self.env.cr.dbname,
+            "invalid_keys",
+            ExpiringSet,
+            int(get_param("auth_api_key.invalid_key_cache_size", 10000)),
+            float(get_param("auth_api_key.invalid_key_cache_ttl", 60)),
+        )
+
+    @api.model
+    def _get_remote_addr_throttle(self):
+        """Return the token buckets of invalid keys per remote address, if any.
+
+        A bucket holds auth_api_key.throttle_burst invalid keys and is refilled
+        with auth_api_key.throttle_rate keys per second, which is 0 by default
+        to disable throttling. The buckets are kept in the memory of the
+        worker, outside of the registry cache.
+        """
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        rate = float(get_param("auth_api_key.throttle_rate", 0))
+        burst = float(get_param("auth_api_key.throttle_burst", 20))
+        if rate <= 0 or burst <= 0:
+            return None
+        return get_store(
+            self.env.cr.dbname, "remote_addr_throttle", TokenBucket, rate, burst
+        )
+
+    @api.model
+    def _search_api_key_by_digest(self, digest):
+        return self.search([("key_digest", "=", digest)], limit=1)
+
+    @api.model
+    def _get_key_digest(self, key):
+        """Return the SHA-256 digest of key.
+
+        It is not keyed with a secret of the database, which changes when the
+        database is duplicated: the keys are stored as they are anyway.
+        """
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _get_indexed_key(self):
+        """Return the key to store the digest of, if any."""
+        self.ensure_one()
+        return self.key
+
+    @api.model
+    def _get_indexed_key_from_vals(self, vals):
+        """Return the key to store the digest of, if any, from the values of
+        a new api key."""
+        return vals.get("key")
+
+    def _update_key_digest(self):
+        for record in self:
+            key = record._get_indexed_key()
+            record.key_digest = key and self._get_key_digest(key)
+
+    def _prepare_rate_limit(self, name):
+        """Return the (name, rate, burst) limit of the record, if any."""
+        self.ensure_one()
+        if self.rate_limit <= 0:
+            return None
+        burst = self.rate_limit_burst or max(1, round(self.rate_limit))
+        return name, self.rate_limit, burst
+
+    def _prepare_rate_limits(self):
+        """Return the (name, rate, burst) limits to apply to the requests
+        authenticated by the api key."""
+        self.ensure_one()
+        limit = self._prepare_rate_limit(f"key:{self.id}")
+        return (limit,) if limit else ()
+
+    @api.model
+    def _get_rate_limits(self, api_key_id):
+        """Return the rate limits of the api key api_key_id.
+
+        They are cached with the valid keys, which the authentication of the
+        request refreshed.
+        """
+        cache = self._get_key_cache()
+        limits = cache.get(("rate_limits", api_key_id))
+        if limits is None:
+            generation = cache.generation
+            limits = self.browse(api_key_id)._prepare_rate_limits()
+            cache.put(("rate_limits", api_key_id), api_key_id, limits, generation)
+        return limits
+
+    @api.model
+    def _get_rate_limit_backend(self):
+        return get_rate_limit_backend(config.get("auth_api_key_rate_limit_redis_url"))
+
+    @api.model
+    def _record_usage(self, api_key_id, remote_addr):
+        """Record a request authenticated by an api key in the worker memory.
+
+        The usage is written to the database by a background thread, at most
+        auth_api_key.usage_flush_interval seconds after it is recorded, and
+        when the worker exits.
+        """
+        dbname = self.env.cr.dbname
+        recorder = get_usage_recorder(dbname)
+        recorder.record(api_key_id, fields.Datetime.now(), remote_addr)
+        interval = float(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("auth_api_key.usage_flush_interval", 60)
+        )
+        recorder.schedule_flush(interval, partial(flush_usage, dbname))
+
+    @api.model
+    def _write_usage(self, usage):
+        """Add usage to the api keys, in a single query."""
+        self.env.cr.execute(  # pylint: disable=sql-injection
+            """
+            UPDATE auth_api_key AS k
+            SET usage_count = COALESCE(k.usage_count, 0) + u.count,
+                last_used = u.last_used,
+                last_ip = u.last_ip
+            FROM (VALUES %s) AS u(id, count, last_used, last_ip)
+            WHERE k.id = u.id
+            """
+            % ", ".join(["(%s, %s, %s::timestamp, %s)"] * len(usage)),
+            [
+                value
+                for api_key_id, (count, last_used, last_ip) in usage.items()
+                for value in (api_key_id, count, last_used, last_ip)
+            ],
+        )
+        self.browse(usage).invalidate_recordset(["usage_count", "last_used", "last_ip"])
+
+    def _get_api_key_info(self):
+        self.ensure_one()
+        return self.id, self.user_id.id, frozenset()
+
+    def init(self):
+        self.env.cr.execute(
+            """
+            CREATE TABLE IF NOT EXISTS auth_api_key_cache_invalidation (
+                api_key_id integer NOT NULL,
+                xid bigint NOT NULL DEFAULT txid_current(),
+                create_date timestamp NOT NULL DEFAULT (now() at time zone 'UTC')
+            )
+            """
+        )
+        tools.create_index(
+            self.env.cr,
+            "auth_api_key_cache_invalidation_xid_index",
+            "auth_api_key_cache_invalidation",
+            ["xid"],
+        )
 
     def _clear_key_cache(self):
-        self._retrieve_api_key_id.clear_cache(self.env[self._name])
-        self._retrieve_uid_from_api_key.clear_cache(self.env[self._name])
+        """Drop the cached entries of the keys from the valid keys of all
+        workers.
+
+        They are dropped at once in this worker, and on their next refresh
+        in the other workers once the transaction is committed.
+        """
+        if not self:
+            return
+        self._get_key_cache().discard(self.ids)
+        self.env.cr.execute(
+            """
+            INSERT INTO auth_api_key_cache_invalidation (api_key_id)
+            SELECT unnest(%s)
+            """,
+            [list(self.ids)],
+        )
+
+    @api.model
+    def _cron_prune_key_cache_invalidations(self):
+        """Delete the invalidations of the key cache older than the entries
+        of the cache, which no worker can need anymore."""
+        ttl = max(
+            float(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("auth_api_key.key_cache_ttl", 60)
+            ),
+            86400,
+        )
+        self.env.cr.execute(
+            """
+            DELETE FROM auth_api_key_cache_invalidation
+            WHERE create_date < (now() at time zone 'UTC') - %s * interval '1 second'
+            """,
+            [ttl],
+        )
+
+    def _invalidate_key_cache(self):
+        """Forget the keys of the records in the invalid keys of this worker.
+
+        The other workers forget them after auth_api_key.invalid_key_cache_ttl
+        seconds. No worker can hold a stale valid entry for them, e.g. when
+        they are created or reactivated.
+        """
+        invalid_keys = self._get_invalid_key_cache()
+        for record in self:
+            if record.key:
+                invalid_keys.discard(self._get_key_digest(record.key))
+
+    @api.model
+    def _generate_key(self):
+        return secrets.token_urlsafe(32)
+
+    def _get_rotation_grace_period(self):
+        return timedelta(
+            seconds=float(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("auth_api_key.rotation_grace_period", 86400)
+            )
+        )
+
+    def _rotate(self, grace_period=None):
+        """Replace the keys with new ones, and make them expire after
+        grace_period, so that clients can switch to the new keys in the meantime.
+
+        Return the new keys.
+        """
+        if grace_period is None:
+            grace_period = self._get_rotation_grace_period()
+        expires_at = fields.Datetime.now() + grace_period
+        successors = self.browse()
+        for record in self:
+            successors |= record.copy(
+                {
+                    "name": _("%(name)s (rotated on %(date)s)")
+                    % {"name": record.name, "date": fields.Datetime.now()},
+                    "key": self._generate_key(),
+                    "rotated_from_id": record.id,
+                }
+            )
+            if not record.expires_at or record.expires_at > expires_at:
+                record.expires_at = expires_at
+        return successors
+
+    def action_rotate(self):
+        self.ensure_one()
+        if not self.active:
+            raise UserError(_("Archived api keys can not be rotated."))
+        successor = self._rotate()
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": successor.id,
+            "view_mode": "form",
+            "target": "current",
+        }
+
+    @api.model
+    def _parse_provision_data(self, data):
+        """Return the rows of a JSON list or a CSV document of api keys."""
+        data = data.strip()
+        if data.startswith("["):
+            try:
+                rows = json.loads(data)
+            except ValueError as e:
+                raise UserError(_("Invalid JSON: %s") % e) from e
+        else:
+            rows = list(csv.DictReader(io.StringIO(data)))
+        self._check_provision_rows(rows)
+        return rows
+
+    @api.model
+    def _check_provision_rows(self, rows):
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise UserError(_("The api keys must be a list of objects."))
+
+    @api.model
+    def _get_provision_user_id(self, row):
+        """Return the id of the user of a row, given by id in its user_id
+        column or by login in its user column, if any."""
+        user_id = row.get("user_id")
+        if user_id:
+            if isinstance(user_id, str) and user_id.strip().isdigit():
+                return int(user_id)
+            if isinstance(user_id, int) and not isinstance(user_id, bool):
+                return user_id
+            raise UserError(
+                _("Invalid user id %(user_id)s for the api key %(name)s")
+                % {"user_id": user_id, "name": row["name"]}
+            )
+        return None
+
+    @api.model
+    def _prepare_provision_vals_list(self, rows):
+        """Return the values to create an api key from each row, with a
+        generated key. A row holds the name of the key and either the login
+        of its user, in its user column, or the id of its user, in its
+        user_id column."""
+        self._check_provision_rows(rows)
+        for row in rows:
+            if not row.get("name"):
+                raise UserError(_("Each api key must have a name."))
+        user_ids = [self._get_provision_user_id(row) for row in rows]
+        logins = [
+            row["user"]
+            for row, user_id in zip(rows, user_ids)
+            if not user_id and isinstance(row.get("user"), str)
+        ]
+        users = self.env["res.users"].search(
+            ["|", ("login", "in", logins), ("id", "in", list(filter(None, user_ids)))]
+        )
+        existing_ids = set(users.ids)
+        ids_by_login = {user.login: user.id for user in users}
+        vals_list = []
+        for row, user_id in zip(rows, user_ids):
+            if user_id is None and isinstance(row.get("user"), str):
+                user_id = ids_by_login.get(row["user"])
+            if user_id not in existing_ids:
+                raise UserError(
+                    _("Unknown user %(user)s for the api key %(name)s")
+                    % {
+                        "user": row.get("user_id") or row.get("user"),
+                        "name": row["name"],
+                    }
+                )
+            vals_list.append(
+                {"name": row["name"], "user_id": user_id, "key": self._generate_key()}
+            )
+        return vals_list
+
+    @api.model
+    def _provision(self, rows):
+        """Create api keys with generated keys from rows, in a single create.
+
+        The generated keys are returned in the key field of the new records.
+        """
+        return self.create(self._prepare_provision_vals_list(rows))
+
+    @api.model
+    def _get_export_fields(self):
+        return [
+            "id",
+            "name",
+            "user",
+            "active",
+            "expires_at",
+            "rate_limit",
+            "rate_limit_burst",
+            "last_used",
+            "usage_count",
+        ]
+
+    def _get_export_values(self):
+        """Return the metadata of the api key, without the key itself."""
+        self.ensure_one()
+        return {
+            "id": self.id,
+            "name": self.name,
+            "user": self.user_id.login,
+            "active": self.active,
+            "expires_at": fields.Datetime.to_string(self.expires_at) or None,
+            "rate_limit": self.rate_limit,
+            "rate_limit_burst": self.rate_limit_burst,
+            "last_used": fields.Datetime.to_string(self.last_used) or None,
+            "usage_count": self.usage_count,
+        }
+
+    @api.model
+    def _cron_deactivate_expired(self):
+        self.search([("expires_at", "<=", fields.Datetime.now())]).write(
+            {"active": False}
+        )
 
     @api.model_create_multi
     def create(self, vals_list):
+        for vals in vals_list:
+            key = self._get_indexed_key_from_vals(vals)
+            vals["key_digest"] = self._get_key_digest(key) if key else False
         records = super(AuthApiKey, self).create(vals_list)
-        if any(["key" in vals or "user_id" in vals for vals in vals_list]):
-            self._clear_key_cache()
+        # new keys can only be stale in the invalid keys of this worker, the
+        # other workers forget them after auth_api_key.invalid_key_cache_ttl
+        records._invalidate_key_cache()
         return records
 
     def write(self, vals):
         super(AuthApiKey, self).write(vals)
-        if "key" in vals or "user_id" in vals:
-            self._clear_key_cache()
+        if "key" in vals:
+            self._update_key_digest()
+        self._clear_key_cache()
+        if "key" in vals or vals.get("active"):
+            self._invalidate_key_cache()
         return True
+
+    def unlink(self):
+        self._clear_key_cache()
+        return super().unlink()
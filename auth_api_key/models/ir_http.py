@@ -4,10 +4,15 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import logging
+import math
 
-from odoo import models
-from odoo.exceptions import AccessDenied
-from odoo.http import request
+from werkzeug.exceptions import TooManyRequests
+
+from odoo import SUPERUSER_ID, _, api, models
+from odoo.exceptions import AccessDenied, ValidationError
+from odoo.http import Response, request
+
+from ..signature import get_signed_message
 
 _logger = logging.getLogger(__name__)
 
@@ -19,18 +24,96 @@ class IrHttp(models.AbstractModel):
     def _auth_method_api_key(cls):
         headers = request.httprequest.environ
         api_key = headers.get("HTTP_API_KEY")
-        if api_key:
-            request.update_env(user=1)
-            auth_api_key = request.env["auth.api.key"]._retrieve_api_key(api_key)
-            if auth_api_key:
-                # reset _env on the request since we change the uid...
-                # the next call to env will instantiate an new
-                # odoo.api.Environment with the user defined on the
-                # auth.api_key
-                request._env = None
-                request.update_env(user=auth_api_key.user_id.id)
-                request.auth_api_key = api_key
-                request.auth_api_key_id = auth_api_key.id
-                return True
+        signature = headers.get("HTTP_API_KEY_SIGNATURE")
+        if api_key or signature:
+            # resolve the key as superuser, and switch the request environment
+            # to the user of the key only once
+            env = api.Environment(request.cr, SUPERUSER_ID, {})
+            AuthApiKey = env["auth.api.key"]
+            remote_addr = request.httprequest.remote_addr
+            try:
+                if signature:
+                    api_key = None
+                    info = cls._retrieve_signed_api_key_info(AuthApiKey, signature)
+                else:
+                    info = AuthApiKey._retrieve_api_key_info(api_key)
+            except ValidationError:
+                # only failed lookups are throttled, a valid key is always
+                # accepted whatever the other clients behind the same address do
+                throttle = AuthApiKey._get_remote_addr_throttle()
+                if throttle and not throttle.consume(remote_addr)[0]:
+                    _logger.warning("Too many wrong HTTP_API_KEY from %s", remote_addr)
+                    raise TooManyRequests(
+                        retry_after=math.ceil(throttle.retry_after(remote_addr))
+                    ) from None
+                raise
+            api_key_id, uid, group_codes = info
+            cls._check_api_key_rate_limits(AuthApiKey.browse(api_key_id))
+            request.update_env(user=uid)
+            request.auth_api_key = api_key
+            request.auth_api_key_id = api_key_id
+            request.auth_api_key_groups = group_codes
+            AuthApiKey._record_usage(api_key_id, remote_addr)
+            return True
         _logger.error("Wrong HTTP_API_KEY, access denied")
         raise AccessDenied()
+
+    @classmethod
+    def _retrieve_signed_api_key_info(cls, AuthApiKey, signature):
+        """Check the signature of the request, made with the key whose id is
+        sent in the API-KEY-ID header at the time sent in the API-KEY-TIMESTAMP
+        header, with the nonce sent in the API-KEY-NONCE header, and return
+        the info of the key."""
+        httprequest = request.httprequest
+        path = httprequest.path
+        if httprequest.query_string:
+            try:
+                path += "?" + httprequest.query_string.decode()
+            except UnicodeDecodeError as e:
+                raise ValidationError(_("Malformed signed request")) from e
+        timestamp = httprequest.environ.get("HTTP_API_KEY_TIMESTAMP") or ""
+        nonce = httprequest.environ.get("HTTP_API_KEY_NONCE") or ""
+        return AuthApiKey._retrieve_api_key_info_from_signature(
+            httprequest.environ.get("HTTP_API_KEY_ID") or "",
+            timestamp,
+            nonce,
+            signature,
+            get_signed_message(
+                timestamp,
+                nonce,
+                httprequest.method,
+                path,
+                httprequest.get_data(cache=True),
+            ),
+        )
+
+    @classmethod
+    def _check_api_key_rate_limits(cls, auth_api_key):
+        """Consume the rate limits of the api key, and add the RateLimit-*
+        headers of the most restrictive one to the response.
+
+        Raise TooManyRequests once one of them is exhausted.
+        """
+        limits = auth_api_key._get_rate_limits(auth_api_key.id)
+        if not limits:
+            return
+        backend = auth_api_key._get_rate_limit_backend()
+        results = []
+        for name, rate, burst in limits:
+            allowed, remaining, reset = backend.consume(
+                f"auth_api_key:{auth_api_key.env.cr.dbname}:{name}", rate, burst
+            )
+            results.append((allowed, remaining, reset, rate, burst))
+        allowed, remaining, reset, rate, burst = min(results, key=lambda r: r[:2])
+        headers = [
+            ("RateLimit-Limit", str(burst)),
+            ("RateLimit-Remaining", str(math.floor(remaining))),
+            ("RateLimit-Reset", str(math.ceil(reset))),
+        ]
+        if not allowed:
+            _logger.info("Rate limit of api key %s exceeded", auth_api_key.name)
+            headers.append(("Retry-After", str(math.ceil((1 - remaining) / rate))))
+            raise TooManyRequests(
+                response=Response("Too Many Requests", status=429, headers=headers)
+            )
+        request.future_response.headers.extend(headers)
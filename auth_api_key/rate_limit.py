@@ -0,0 +1,105 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+import threading
+import time
+
+from .throttle import TokenBucket
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+    _logger.debug("Cannot import redis.")
+
+
+class LocalRateLimitBackend:
+    """Token buckets kept in the memory of the worker."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst):
+        """Take a token from the bucket of key.
+
+        Return (allowed, remaining tokens, seconds until the bucket is full).
+        """
+        bucket = self._buckets.get((rate, burst))
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(
+                    (rate, burst), TokenBucket(rate, burst, self.max_size)
+                )
+        return bucket.consume(key)
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by all workers in a Redis server.
+
+    If the server can not be reached, requests are allowed.
+    """
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+        local tokens = tonumber(state[1]) or burst
+        local updated_at = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", ARGV[3])
+        redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key, rate, burst):
+        try:
+            allowed, tokens = self._script(keys=[key], args=[rate, burst, time.time()])
+        except redis.RedisError:
+            _logger.exception("Could not check the rate limit of %s", key)
+            return True, burst, 0
+        tokens = float(tokens)
+        return bool(allowed), tokens, (burst - tokens) / rate
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_rate_limit_backend(redis_url=None):
+    """Return the backend shared through redis_url, or the local one.
+
+    The local backend is also used when the redis library is not installed.
+    """
+    backend = _backends.get(redis_url)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(redis_url)
+            if backend is None:
+                if redis_url and redis is None:
+                    _logger.warning(
+                        "The redis library is not installed, the rate limits "
+                        "are enforced in each worker instead of in %s",
+                        redis_url,
+                    )
+                    backend = LocalRateLimitBackend()
+                elif redis_url:
+                    backend = RedisRateLimitBackend(redis_url)
+                else:
+                    backend = LocalRateLimitBackend()
+                _backends[redis_url] = backend
+    return backend
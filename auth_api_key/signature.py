@@ -0,0 +1,54 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import hashlib
+import hmac
+import threading
+
+from .throttle import ExpiringSet
+
+# longest nonce accepted, to bound the memory used to remember them
+MAX_NONCE_LENGTH = 128
+
+
+def get_signed_message(timestamp, nonce, method, path, body):
+    """Return the message signed by the clients.
+
+    It is made of the timestamp, the nonce chosen by the client, the HTTP
+    method, the path (with the query string, if any) and the hex SHA-256
+    digest of the body, one per line.
+    """
+    return "\n".join(
+        [
+            str(timestamp),
+            nonce,
+            method.upper(),
+            path,
+            hashlib.sha256(body).hexdigest(),
+        ]
+    ).encode()
+
+
+def sign(key, message):
+    """Return the hex HMAC-SHA256 signature of message with key."""
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+_replay_caches = {}
+_replay_caches_lock = threading.Lock()
+
+
+def get_replay_cache(dbname, max_size, ttl):
+    """Return the set of the (api key id, nonce) recently received by the
+    worker.
+
+    It is kept per database, and outlives the registry cache so that clearing
+    the caches of the api keys does not allow replays.
+    """
+    cache = _replay_caches.get(dbname)
+    if cache is None or (cache.max_size, cache.ttl) != (max_size, ttl):
+        with _replay_caches_lock:
+            cache = _replay_caches.get(dbname)
+            if cache is None or (cache.max_size, cache.ttl) != (max_size, ttl):
+                cache = _replay_caches[dbname] = ExpiringSet(max_size, ttl)
+    return cache
@@ -1 +1,3 @@
 from . import test_auth_api_key
+from . import test_throttle
+from . import test_provision
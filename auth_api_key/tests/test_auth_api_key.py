@@ -1,10 +1,52 @@
 # Copyright 2018 ACSONE SA/NV
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+import contextlib
+import logging
+import secrets
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from psycopg2 import IntegrityError
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import TooManyRequests
+
+import odoo.http
+from odoo import api, fields
 from odoo.exceptions import AccessError, ValidationError
 from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+from ..rate_limit import LocalRateLimitBackend
+from ..signature import get_signed_message, sign
+from ..throttle import clear_stores
+from ..usage import UsageRecorder, get_usage_recorder
+
+_logger = logging.getLogger(__name__)
 
 
 class TestAuthApiKey(TransactionCase):
+    @contextlib.contextmanager
+    def _mock_request(self, api_key, remote_addr="127.0.0.1", environ=None, body=b""):
+        request = Mock(
+            httprequest=Mock(
+                environ=environ or {"HTTP_API_KEY": api_key},
+                remote_addr=remote_addr,
+                method="POST",
+                path="/my_service",
+                query_string=b"",
+                get_data=Mock(return_value=body),
+            ),
+            env=self.env,
+            cr=self.env.cr,
+            future_response=Mock(headers=Headers()),
+        )
+        with contextlib.ExitStack() as s:
+            odoo.http._request_stack.push(request)
+            s.callback(odoo.http._request_stack.pop)
+            yield request
+
     @classmethod
     def setUpClass(cls, *args, **kwargs):
         super().setUpClass(*args, **kwargs)
@@ -14,6 +56,13 @@ class TestAuthApiKey(TransactionCase):
             {"name": "good", "user_id": cls.demo_user.id, "key": "api_key"}
         )
 
+    def setUp(self):
+        super().setUp()
+        # the caches of the keys and the throttle outlive the registry cache
+        self.addCleanup(clear_stores, self.env.cr.dbname)
+        # the usage of rolled back keys must not be written
+        self.addCleanup(get_usage_recorder(self.env.cr.dbname).pop)
+
     def test_lookup_key_from_db(self):
         demo_user = self.env.ref("base.user_demo")
         self.assertEqual(
@@ -43,3 +92,408 @@ class TestAuthApiKey(TransactionCase):
         )
         with self.assertRaises(ValidationError):
             self.env["auth.api.key"]._retrieve_uid_from_api_key("api_key")
+
+    def test_key_digest(self):
+        digest = self.AuthApiKey._get_key_digest("api_key")
+        self.assertEqual(self.api_key_good.key_digest, digest)
+        self.assertNotEqual(digest, self.AuthApiKey._get_key_digest("api_key2"))
+        self.api_key_good.write({"key": "updated_key"})
+        self.assertEqual(
+            self.api_key_good.key_digest,
+            self.AuthApiKey._get_key_digest("updated_key"),
+        )
+
+    def test_key_digest_database_duplicate(self):
+        # a duplicated database gets a new database.secret
+        secret = self.env["ir.config_parameter"].get_param("database.secret")
+        self.env["ir.config_parameter"].init(force=True)
+        self.assertNotEqual(
+            self.env["ir.config_parameter"].get_param("database.secret"), secret
+        )
+        self.AuthApiKey.clear_caches()
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_key"), self.api_key_good.id
+        )
+
+    def test_wrong_key_single_query(self):
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_wrong_key")
+        # the lookup of a key is a single indexed query, besides the refresh
+        # of the key cache
+        with self.assertQueryCount(2), self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_wrong_key2")
+
+    @mute_logger("odoo.sql_db")
+    def test_duplicate_key(self):
+        with self.assertRaises(IntegrityError), self.env.cr.savepoint():
+            self.AuthApiKey.create(
+                {"name": "duplicate", "user_id": self.demo_user.id, "key": "api_key"}
+            )
+
+    def test_invalid_key_cache(self):
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_wrong_key")
+        with self.assertQueryCount(0), self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_wrong_key")
+        # the invalid keys are forgotten when keys change
+        self.api_key_good.write({"key": "api_wrong_key"})
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_wrong_key"), self.api_key_good.id
+        )
+
+    def test_throttle(self):
+        set_param = self.env["ir.config_parameter"].sudo().set_param
+        set_param("auth_api_key.throttle_rate", 0.1)
+        set_param("auth_api_key.throttle_burst", 2)
+        for _i in range(2):
+            with self._mock_request("api_wrong_key"), self.assertRaises(
+                ValidationError
+            ):
+                self.env["ir.http"]._auth_method_api_key()
+        # the budget of the address is exhausted
+        with self._mock_request("api_wrong_key"), self.assertRaises(TooManyRequests):
+            self.env["ir.http"]._auth_method_api_key()
+        # clearing the registry cache does not reset it
+        self.AuthApiKey.clear_caches()
+        with self._mock_request("api_wrong_key2"), self.assertRaises(TooManyRequests):
+            self.env["ir.http"]._auth_method_api_key()
+        # other addresses are not throttled
+        with self._mock_request(
+            "api_wrong_key", remote_addr="127.0.0.2"
+        ), self.assertRaises(ValidationError):
+            self.env["ir.http"]._auth_method_api_key()
+
+    def test_throttle_valid_key(self):
+        set_param = self.env["ir.config_parameter"].sudo().set_param
+        set_param("auth_api_key.throttle_rate", 0.1)
+        set_param("auth_api_key.throttle_burst", 1)
+        with self._mock_request("api_wrong_key"), self.assertRaises(ValidationError):
+            self.env["ir.http"]._auth_method_api_key()
+        with self._mock_request("api_wrong_key"), self.assertRaises(TooManyRequests):
+            self.env["ir.http"]._auth_method_api_key()
+        # a valid key is accepted from the address whose budget is exhausted
+        with self._mock_request("api_key") as request:
+            self.env["ir.http"]._auth_method_api_key()
+            self.assertEqual(request.auth_api_key_id, self.api_key_good.id)
+
+    def test_throttle_disabled_by_default(self):
+        for _i in range(30):
+            with self._mock_request("api_wrong_key"), self.assertRaises(
+                ValidationError
+            ):
+                self.env["ir.http"]._auth_method_api_key()
+
+    def test_usage(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "auth_api_key.usage_flush_interval", 3600
+        )
+        recorder = get_usage_recorder(self.env.cr.dbname)
+        recorder.pop()
+        for remote_addr in ("127.0.0.1", "127.0.0.2"):
+            with self._mock_request("api_key", remote_addr=remote_addr):
+                self.env["ir.http"]._auth_method_api_key()
+        usage = recorder.pop()
+        self.assertEqual(usage[self.api_key_good.id][0], 2)
+        with self.assertQueryCount(1):
+            self.AuthApiKey._write_usage(usage)
+        self.assertEqual(self.api_key_good.usage_count, 2)
+        self.assertEqual(self.api_key_good.last_ip, "127.0.0.2")
+        self.assertTrue(self.api_key_good.last_used)
+        self.AuthApiKey._write_usage(usage)
+        self.assertEqual(self.api_key_good.usage_count, 4)
+
+    def test_usage_flush(self):
+        recorder = UsageRecorder()
+        flush = Mock()
+        recorder.schedule_flush(3600, flush)
+        # a single flush is scheduled at a time
+        recorder.schedule_flush(3600, flush)
+        # the scheduled flush runs when the worker exits
+        recorder.flush_now()
+        flush.assert_called_once_with()
+        recorder.flush_now()
+        flush.assert_called_once_with()
+        # without any other request
+        flushed = threading.Event()
+        recorder.schedule_flush(0, flushed.set)
+        self.assertTrue(flushed.wait(10))
+
+    def test_rate_limit(self):
+        self.api_key_good.write({"rate_limit": 0.01, "rate_limit_burst": 2})
+        backend = LocalRateLimitBackend()
+        with patch.object(
+            type(self.AuthApiKey), "_get_rate_limit_backend", return_value=backend
+        ):
+            with self._mock_request("api_key") as request:
+                self.env["ir.http"]._auth_method_api_key()
+                headers = request.future_response.headers
+                self.assertEqual(headers["RateLimit-Limit"], "2")
+                self.assertEqual(headers["RateLimit-Remaining"], "1")
+                self.assertEqual(headers["RateLimit-Reset"], "100")
+            with self._mock_request("api_key"):
+                self.env["ir.http"]._auth_method_api_key()
+            with self._mock_request("api_key"), self.assertRaises(
+                TooManyRequests
+            ) as error:
+                self.env["ir.http"]._auth_method_api_key()
+        response = error.exception.get_response()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["RateLimit-Remaining"], "0")
+        self.assertEqual(response.headers["Retry-After"], "100")
+
+    def _switch_request_env(self, request):
+        # switch the environment of the mocked request like Request.update_env
+        request.update_env.side_effect = lambda user: setattr(
+            request, "env", request.env(user=user)
+        )
+
+    def test_auth_method_benchmark(self):
+        with self._mock_request("api_key") as request:
+            self._switch_request_env(request)
+            self.env["ir.http"]._auth_method_api_key()
+        envs = set(self.env.transaction.envs)
+        queries = self.cr.sql_log_count
+        start = time.perf_counter()
+        with patch.object(
+            api.Environment, "__new__", side_effect=api.Environment.__new__
+        ) as new_environment:
+            for _i in range(100):
+                with self._mock_request("api_key") as request:
+                    self._switch_request_env(request)
+                    self.env["ir.http"]._auth_method_api_key()
+                    self.assertEqual(request.env.uid, self.demo_user.id)
+                    self.assertEqual(request.auth_api_key_id, self.api_key_good.id)
+        elapsed = time.perf_counter() - start
+        queries = self.cr.sql_log_count - queries
+        new_envs = len(set(self.env.transaction.envs) - envs)
+        # Environment.__new__(cls, cr, uid, context, su=False)
+        user_environments = [
+            call
+            for call in new_environment.call_args_list
+            if call.args[2] == self.demo_user.id
+        ]
+        _logger.info(
+            "_auth_method_api_key: %.1f us, %g environment instantiations, "
+            "%g new environments, %g queries per request",
+            elapsed * 10000,
+            new_environment.call_count / 100,
+            new_envs / 100,
+            queries / 100,
+        )
+        # the request environment is switched to the user of the key once
+        self.assertEqual(len(user_environments), 100)
+        self.assertEqual(new_envs, 0)
+        # the refresh of the key cache
+        self.assertEqual(queries, 100)
+
+    def test_expiry(self):
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_key"), self.api_key_good.id
+        )
+        self.api_key_good.expires_at = fields.Datetime.now() - timedelta(seconds=1)
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_key")
+        self.AuthApiKey._cron_deactivate_expired()
+        self.assertFalse(self.api_key_good.active)
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_key")
+
+    def test_rotate(self):
+        successor = self.api_key_good._rotate(grace_period=timedelta(hours=1))
+        self.assertEqual(successor.rotated_from_id, self.api_key_good)
+        self.assertEqual(successor.user_id, self.demo_user)
+        self.assertFalse(successor.expires_at)
+        self.assertNotEqual(successor.key, "api_key")
+        self.assertTrue(self.api_key_good.expires_at > fields.Datetime.now())
+        # both keys are accepted during the grace period
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_key"), self.api_key_good.id
+        )
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id(successor.key), successor.id
+        )
+
+    def test_rotate_keeps_cache(self):
+        api_key = self.AuthApiKey.create(
+            {"name": "other", "user_id": self.demo_user.id, "key": "other_key"}
+        )
+        self.AuthApiKey._retrieve_api_key_id("other_key")
+        successor = self.api_key_good._rotate(grace_period=timedelta(hours=1))
+        # only the entries of the rotated key are dropped
+        with self.assertQueryCount(1):
+            self.assertEqual(
+                self.AuthApiKey._retrieve_api_key_id("other_key"), api_key.id
+            )
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_key"), self.api_key_good.id
+        )
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id(successor.key), successor.id
+        )
+
+    def test_key_cache_ttl(self):
+        self.AuthApiKey._retrieve_api_key_id("api_key")
+        # a change made without invalidating the key cache is only seen once
+        # the cached entry expires
+        self.env.cr.execute(
+            "UPDATE auth_api_key SET active = false WHERE id = %s",
+            [self.api_key_good.id],
+        )
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_key"), self.api_key_good.id
+        )
+        expired = time.monotonic() + 61
+        with patch(
+            "odoo.addons.auth_api_key.throttle.time.monotonic", return_value=expired
+        ), self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_key")
+
+    def test_key_changed_by_other_worker(self):
+        api_key = self.AuthApiKey.create(
+            {"name": "other", "user_id": self.demo_user.id, "key": "other_key"}
+        )
+        self.AuthApiKey._retrieve_api_key_id("api_key")
+        self.AuthApiKey._retrieve_api_key_id("other_key")
+        # another worker archives the key, and invalidates its cached entries
+        self.env.cr.execute(
+            "UPDATE auth_api_key SET active = false WHERE id = %s",
+            [self.api_key_good.id],
+        )
+        self.env.cr.execute(
+            "INSERT INTO auth_api_key_cache_invalidation (api_key_id) VALUES (%s)",
+            [self.api_key_good.id],
+        )
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("api_key")
+        # the entries of the other keys are kept
+        with self.assertQueryCount(1):
+            self.assertEqual(
+                self.AuthApiKey._retrieve_api_key_id("other_key"), api_key.id
+            )
+
+    def test_prune_key_cache_invalidations(self):
+        self.api_key_good.write({"rate_limit": 1})
+        self.env.cr.execute(
+            """
+            UPDATE auth_api_key_cache_invalidation
+            SET create_date = create_date - interval '2 days'
+            WHERE api_key_id = %s
+            """,
+            [self.api_key_good.id],
+        )
+        self.AuthApiKey._cron_prune_key_cache_invalidations()
+        self.env.cr.execute(
+            "SELECT 1 FROM auth_api_key_cache_invalidation WHERE api_key_id = %s",
+            [self.api_key_good.id],
+        )
+        self.assertFalse(self.env.cr.fetchall())
+
+    def test_create_keeps_cache(self):
+        self.AuthApiKey._retrieve_api_key_id("api_key")
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("new_key")
+        api_key = self.AuthApiKey.create(
+            {"name": "new", "user_id": self.demo_user.id, "key": "new_key"}
+        )
+        # creating a key does not clear the cached keys
+        with self.assertQueryCount(1):
+            self.AuthApiKey._retrieve_api_key_id("api_key")
+        self.assertEqual(self.AuthApiKey._retrieve_api_key_id("new_key"), api_key.id)
+
+    def _signed_environ(self, api_key, body=b"", timestamp=None, key=None, nonce=None):
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        nonce = secrets.token_hex(16) if nonce is None else nonce
+        message = get_signed_message(timestamp, nonce, "POST", "/my_service", body)
+        return {
+            "HTTP_API_KEY_ID": str(api_key.id),
+            "HTTP_API_KEY_TIMESTAMP": str(timestamp),
+            "HTTP_API_KEY_NONCE": nonce,
+            "HTTP_API_KEY_SIGNATURE": sign((key or api_key.key).encode(), message),
+        }
+
+    def test_signed_request(self):
+        environ = self._signed_environ(self.api_key_good, body=b'{"a": 1}')
+        with self._mock_request(None, environ=environ, body=b'{"a": 1}') as request:
+            self.env["ir.http"]._auth_method_api_key()
+            self.assertEqual(request.auth_api_key_id, self.api_key_good.id)
+            self.assertIsNone(request.auth_api_key)
+            request.update_env.assert_called_once_with(user=self.demo_user.id)
+        # a signed request is accepted only once
+        with self._mock_request(
+            None, environ=environ, body=b'{"a": 1}'
+        ), self.assertRaises(ValidationError):
+            self.env["ir.http"]._auth_method_api_key()
+
+    def test_signed_request_invalid(self):
+        for environ, body in (
+            # tampered body
+            (self._signed_environ(self.api_key_good, body=b"a"), b"b"),
+            # wrong key
+            (self._signed_environ(self.api_key_good, key="api_wrong_key"), b""),
+            # too old
+            (
+                self._signed_environ(
+                    self.api_key_good, timestamp=int(time.time()) - 600
+                ),
+                b"",
+            ),
+            # unknown key
+            (self._signed_environ(Mock(id=2**31 - 1, key="api_key")), b""),
+            # malformed
+            ({"HTTP_API_KEY_SIGNATURE": "signature"}, b""),
+            # no nonce
+            (self._signed_environ(self.api_key_good, nonce=""), b""),
+            # nonce too long
+            (self._signed_environ(self.api_key_good, nonce="n" * 129), b""),
+        ):
+            with self._mock_request(
+                None, environ=environ, body=body
+            ), self.assertRaises(ValidationError):
+                self.env["ir.http"]._auth_method_api_key()
+
+    def test_signed_request_query_string(self):
+        environ = self._signed_environ(self.api_key_good)
+        with self._mock_request(None, environ=environ) as request:
+            request.httprequest.query_string = b"a=\xff"
+            with self.assertRaises(ValidationError):
+                self.env["ir.http"]._auth_method_api_key()
+
+    def test_signed_request_nonce(self):
+        environ = self._signed_environ(self.api_key_good, nonce="nonce")
+        with self._mock_request(None, environ=environ):
+            self.env["ir.http"]._auth_method_api_key()
+        # a nonce is accepted only once per key, even for another request
+        environ = self._signed_environ(self.api_key_good, body=b"b", nonce="nonce")
+        with self._mock_request(None, environ=environ, body=b"b"), self.assertRaises(
+            ValidationError
+        ):
+            self.env["ir.http"]._auth_method_api_key()
+        api_key = self.AuthApiKey.create(
+            {"name": "other", "user_id": self.demo_user.id, "key": "other_key"}
+        )
+        environ = self._signed_environ(api_key, nonce="nonce")
+        with self._mock_request(None, environ=environ) as request:
+            self.env["ir.http"]._auth_method_api_key()
+            self.assertEqual(request.auth_api_key_id, api_key.id)
+
+    def test_signed_request_lookup_by_id(self):
+        environ = self._signed_environ(self.api_key_good)
+        with self._mock_request(None, environ=environ):
+            self.env["ir.http"]._auth_method_api_key()
+        # the signing key is cached
+        environ = self._signed_environ(self.api_key_good, body=b"other")
+        with self.assertQueryCount(1), self._mock_request(
+            None, environ=environ, body=b"other"
+        ):
+            self.env["ir.http"]._auth_method_api_key()
+        # and forgotten when the key changes
+        self.api_key_good.write({"key": "updated_key"})
+        environ = self._signed_environ(self.api_key_good, key="api_key")
+        with self._mock_request(None, environ=environ), self.assertRaises(
+            ValidationError
+        ):
+            self.env["ir.http"]._auth_method_api_key()
+        environ = self._signed_environ(self.api_key_good)
+        with self._mock_request(None, environ=environ) as request:
+            self.env["ir.http"]._auth_method_api_key()
+            self.assertEqual(request.auth_api_key_id, self.api_key_good.id)
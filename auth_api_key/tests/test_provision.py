@@ -0,0 +1,179 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+import base64
+import csv
+import io
+import json
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import HttpCase, tagged
+from odoo.tests.common import TransactionCase
+
+
+class TestProvision(TransactionCase):
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        super().setUpClass(*args, **kwargs)
+        cls.AuthApiKey = cls.env["auth.api.key"]
+        cls.demo_user = cls.env.ref("base.user_demo")
+
+    def test_parse_provision_data(self):
+        rows = [{"name": "k1", "user": "demo"}, {"name": "k2", "user": "admin"}]
+        self.assertEqual(
+            self.AuthApiKey._parse_provision_data("name,user\nk1,demo\nk2,admin\n"),
+            rows,
+        )
+        self.assertEqual(self.AuthApiKey._parse_provision_data(json.dumps(rows)), rows)
+        with self.assertRaises(UserError):
+            self.AuthApiKey._parse_provision_data("[1, 2]")
+        with self.assertRaises(UserError):
+            self.AuthApiKey._parse_provision_data("[{")
+        rows = self.AuthApiKey._parse_provision_data(
+            f"name,user_id\nk1,{self.demo_user.id}\n"
+        )
+        self.assertEqual(
+            self.AuthApiKey._prepare_provision_vals_list(rows)[0]["user_id"],
+            self.demo_user.id,
+        )
+
+    def test_provision_login_of_digits(self):
+        user = self.env["res.users"].create(
+            {"name": "Digits", "login": str(self.env.ref("base.user_admin").id)}
+        )
+        # a login made of digits is not taken for the id of another user
+        vals_list = self.AuthApiKey._prepare_provision_vals_list(
+            [{"name": "k1", "user": user.login}]
+        )
+        self.assertEqual(vals_list[0]["user_id"], user.id)
+
+    def test_provision(self):
+        with patch.object(
+            type(self.AuthApiKey), "_clear_key_cache", autospec=True
+        ) as clear_key_cache:
+            api_keys = self.AuthApiKey._provision(
+                [
+                    {"name": "k1", "user": "demo"},
+                    {"name": "k2", "user_id": self.demo_user.id},
+                ]
+            )
+        clear_key_cache.assert_not_called()
+        self.assertEqual(api_keys.mapped("name"), ["k1", "k2"])
+        self.assertEqual(api_keys.user_id, self.demo_user)
+        self.assertTrue(all(api_keys.mapped("key")))
+        self.assertNotEqual(api_keys[0].key, api_keys[1].key)
+        for api_key in api_keys:
+            self.assertEqual(
+                self.AuthApiKey._retrieve_api_key_id(api_key.key), api_key.id
+            )
+
+    def test_provision_unknown_user(self):
+        with self.assertRaises(UserError):
+            self.AuthApiKey._provision([{"name": "k1", "user": "nobody"}])
+        with self.assertRaises(UserError):
+            self.AuthApiKey._provision([{"user": "demo"}])
+        with self.assertRaises(UserError):
+            self.AuthApiKey._provision([{"name": "k1", "user": self.demo_user.id}])
+        with self.assertRaises(UserError):
+            self.AuthApiKey._provision([{"name": "k1", "user_id": "demo"}])
+        with self.assertRaises(UserError):
+            self.AuthApiKey._provision(["k1"])
+        self.assertFalse(self.AuthApiKey.search([("name", "=", "k1")]))
+
+    def test_export_values(self):
+        api_key = self.AuthApiKey.create(
+            {"name": "k1", "user_id": self.demo_user.id, "key": "secret"}
+        )
+        values = api_key._get_export_values()
+        self.assertEqual(set(values), set(self.AuthApiKey._get_export_fields()))
+        self.assertEqual(values["user"], "demo")
+        self.assertNotIn("secret", values.values())
+
+    def test_wizard(self):
+        wizard = self.env["auth.api.key.provision.wizard"].create(
+            {"data_file": base64.b64encode(b"name,user\nk1,demo\n")}
+        )
+        action = wizard.action_provision()
+        api_key = self.AuthApiKey.search([("name", "=", "k1")])
+        self.assertFalse(wizard.data_file)
+        # the keys are only shown in a new wizard, which is not saved
+        self.assertFalse(wizard.result)
+        self.assertFalse(action.get("res_id"))
+        values = (
+            self.env["auth.api.key.provision.wizard"]
+            .with_context(**action["context"])
+            .default_get(["state", "result"])
+        )
+        self.assertEqual(values["state"], "done")
+        self.assertEqual(
+            list(csv.reader(io.StringIO(values["result"]))),
+            [["name", "key"], ["k1", api_key.key]],
+        )
+
+
+@tagged("post_install", "-at_install")
+class TestProvisionEndpoints(HttpCase):
+    def _provision(self, keys):
+        resp = self.url_open(
+            "/auth_api_key/provision",
+            data=json.dumps({"jsonrpc": "2.0", "params": {"keys": keys}}),
+            headers={"Content-Type": "application/json"},
+        )
+        return resp.json()
+
+    def test_provision(self):
+        self.authenticate("admin", "admin")
+        result = self._provision([{"name": "k1", "user": "demo"}])["result"]
+        api_key = self.env["auth.api.key"].browse(result[0]["id"])
+        self.assertEqual(result, [{"id": api_key.id, "name": "k1", "key": api_key.key}])
+        result = self._provision("name,user\nk2,demo\n")["result"]
+        self.assertEqual(result[0]["name"], "k2")
+
+    def test_provision_malformed(self):
+        self.authenticate("admin", "admin")
+        result = self._provision(["k1"])
+        self.assertEqual(result["error"]["data"]["name"], "odoo.exceptions.UserError")
+
+    def test_provision_not_allowed(self):
+        self.authenticate("demo", "demo")
+        self.assertIn("error", self._provision([{"name": "k1", "user": "demo"}]))
+        self.assertFalse(self.env["auth.api.key"].search([("name", "=", "k1")]))
+
+    def test_export(self):
+        api_keys = self.env["auth.api.key"].create(
+            [
+                {
+                    "name": "k1",
+                    "user_id": self.env.ref("base.user_demo").id,
+                    "key": "s1",
+                },
+                {
+                    "name": "k2",
+                    "user_id": self.env.ref("base.user_admin").id,
+                    "key": "s2",
+                },
+            ]
+        )
+        self.authenticate("admin", "admin")
+        with patch("odoo.addons.auth_api_key.controllers.main.EXPORT_BATCH_SIZE", 1):
+            resp = self.url_open("/auth_api_key/export")
+            self.assertEqual(resp.status_code, 200)
+            rows = list(csv.DictReader(io.StringIO(resp.text)))
+            self.assertEqual(
+                [row["name"] for row in rows if row["id"] in map(str, api_keys.ids)],
+                ["k1", "k2"],
+            )
+            self.assertNotIn("s1", resp.text)
+            resp = self.url_open("/auth_api_key/export?export_format=jsonl")
+            rows = [json.loads(line) for line in resp.text.splitlines()]
+            self.assertIn(
+                {"id": api_keys[1].id, "name": "k2", "user": "admin"},
+                [{k: row[k] for k in ("id", "name", "user")} for row in rows],
+            )
+        resp = self.url_open("/auth_api_key/export?export_format=xml")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_export_not_allowed(self):
+        self.authenticate("demo", "demo")
+        resp = self.url_open("/auth_api_key/export")
+        self.assertEqual(resp.status_code, 403)
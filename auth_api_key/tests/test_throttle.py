@@ -0,0 +1,45 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+
+from .. import rate_limit
+from ..throttle import ExpiringSet, TokenBucket
+
+
+class TestThrottle(BaseCase):
+    @patch("odoo.addons.auth_api_key.throttle.time.monotonic")
+    def test_expiring_set(self, monotonic):
+        monotonic.return_value = 100
+        keys = ExpiringSet(max_size=2, ttl=10)
+        self.assertTrue(keys.add("a"))
+        self.assertFalse(keys.add("a"))
+        keys.add("b")
+        keys.add("c")
+        self.assertNotIn("a", keys)
+        self.assertIn("b", keys)
+        monotonic.return_value = 110
+        self.assertNotIn("b", keys)
+        self.assertTrue(keys.add("b"))
+
+    @patch("odoo.addons.auth_api_key.throttle.time.monotonic")
+    def test_token_bucket(self, monotonic):
+        monotonic.return_value = 100
+        bucket = TokenBucket(rate=1, burst=2)
+        self.assertEqual(bucket.consume("a"), (True, 1, 1))
+        self.assertEqual(bucket.consume("a"), (True, 0, 2))
+        self.assertEqual(bucket.consume("a"), (False, 0, 2))
+        self.assertEqual(bucket.retry_after("a"), 1)
+        self.assertEqual(bucket.peek("b"), 2)
+        monotonic.return_value = 101.5
+        self.assertEqual(bucket.peek("a"), 1.5)
+        self.assertTrue(bucket.consume("a")[0])
+
+    def test_rate_limit_backend_without_redis(self):
+        with patch.object(rate_limit, "redis", None), patch.dict(
+            rate_limit._backends, clear=True
+        ), self.assertLogs(rate_limit._logger, "WARNING"):
+            backend = rate_limit.get_rate_limit_backend("redis://localhost")
+        self.assertIsInstance(backend, rate_limit.LocalRateLimitBackend)
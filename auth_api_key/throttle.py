@@ -0,0 +1,204 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ExpiringSet:
+    """Thread-safe set of at most max_size keys, each kept for ttl seconds.
+
+    The least recently added keys are dropped first when it is full.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key):
+        """Add key, and return whether it was not already in the set."""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(key)
+            self._entries[key] = now + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return expires_at is None or expires_at <= now
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class TokenBucket:
+    """Thread-safe token buckets, one per key.
+
+    Each bucket holds at most burst tokens and is refilled with rate tokens
+    per second. At most max_size buckets are kept, the least recently used
+    ones are dropped first, which is the same as refilling them.
+    """
+
+    def __init__(self, rate, burst, max_size=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key, now):
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def peek(self, key):
+        """Return the number of tokens available in the bucket of key."""
+        with self._lock:
+            return self._refill(key, time.monotonic())
+
+    def consume(self, key, tokens=1):
+        """Take tokens from the bucket of key.
+
+        Return (allowed, remaining tokens, seconds until the bucket is full).
+        Nothing is taken when there are not enough tokens.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = self._refill(key, now)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            self._buckets[key] = (available, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        reset = (self.burst - available) / self.rate if self.rate else 0
+        return allowed, available, reset
+
+    def retry_after(self, key, tokens=1):
+        """Return the number of seconds until tokens are available for key."""
+        missing = tokens - self.peek(key)
+        if missing <= 0:
+            return 0
+        return missing / self.rate if self.rate else None
+
+
+class KeyCache:
+    """Thread-safe cache of at most max_size entries of valid api keys, each
+    kept for ttl seconds.
+
+    Each entry belongs to an api key, so that all the entries of a key can be
+    dropped at once. An entry loaded before such a drop is not stored.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        # incremented by each drop of entries
+        self.generation = 0
+        # the invalidations of the transactions from xmin on can still be
+        # unseen, seen holds those that were already applied
+        self.xmin = 0
+        self.seen = frozenset()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, api_key_id, value, generation):
+        """Store the value of key, of the api key api_key_id, loaded when the
+        cache was at generation."""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                # the value may have been loaded before its entries were dropped
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, api_key_id, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, api_key_ids):
+        """Drop the entries of the api keys api_key_ids."""
+        api_key_ids = set(api_key_ids)
+        with self._lock:
+            self.generation += 1
+            for key in [
+                key for key, entry in self._entries.items() if entry[1] in api_key_ids
+            ]:
+                del self._entries[key]
+
+    def apply_invalidations(self, xmin, invalidations):
+        """Drop the entries of the api keys of the (transaction id, api key id)
+        invalidations not applied yet, and remember that only the
+        invalidations of the transactions from xmin on can still be unseen."""
+        invalidations = frozenset(invalidations)
+        with self._lock:
+            api_key_ids = {api_key_id for _xid, api_key_id in invalidations - self.seen}
+            self.xmin = xmin
+            self.seen = invalidations
+        if api_key_ids:
+            self.discard(api_key_ids)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(dbname, name, factory, *args):
+    """Return the store name of the worker for dbname, made by factory(*args).
+
+    Stores are kept per database in the worker memory rather than in the
+    registry cache, so that clearing the registry cache does not reset them.
+    A store is made again when args change.
+    """
+    key = (dbname, name)
+    store = _stores.get(key)
+    if store is None or store[0] != args:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None or store[0] != args:
+                store = _stores[key] = (args, factory(*args))
+    return store[1]
+
+
+def clear_stores(dbname):
+    """Drop the stores of the worker for dbname."""
+    with _stores_lock:
+        for key in [key for key in _stores if key[0] == dbname]:
+            del _stores[key]
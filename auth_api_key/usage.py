@@ -0,0 +1,91 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import atexit
+import threading
+
+
+class UsageRecorder:
+    """Thread-safe accumulator of the usage of api keys in a worker.
+
+    Usage is kept per api key id as (request count, last used, last remote
+    address), until it is popped to be written to the database.
+    """
+
+    def __init__(self):
+        self._usage = {}
+        self._lock = threading.Lock()
+        self._flush_timer = None
+
+    def record(self, api_key_id, last_used, last_ip):
+        with self._lock:
+            count = self._usage.get(api_key_id, (0,))[0]
+            self._usage[api_key_id] = (count + 1, last_used, last_ip)
+
+    def pop(self):
+        with self._lock:
+            usage, self._usage = self._usage, {}
+        return usage
+
+    def restore(self, usage):
+        """Merge usage that could not be written back into the recorder."""
+        with self._lock:
+            for api_key_id, (count, last_used, last_ip) in usage.items():
+                current = self._usage.get(api_key_id)
+                if current is not None:
+                    count += current[0]
+                    if current[1] >= last_used:
+                        last_used, last_ip = current[1:]
+                self._usage[api_key_id] = (count, last_used, last_ip)
+
+    def schedule_flush(self, interval, flush):
+        """Call flush in a background thread in interval seconds, unless a
+        flush is already scheduled.
+
+        The flush does not depend on further requests, and is run at once if
+        the worker exits in the meantime.
+        """
+        if self._flush_timer is not None:
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(interval, self._flush, (flush,))
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush(self, flush):
+        with self._lock:
+            self._flush_timer = None
+        flush()
+
+    def flush_now(self):
+        """Run the scheduled flush at once, if any."""
+        with self._lock:
+            timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+            timer.args[0]()
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_usage_recorder(dbname):
+    recorder = _recorders.get(dbname)
+    if recorder is None:
+        with _recorders_lock:
+            recorder = _recorders.setdefault(dbname, UsageRecorder())
+    return recorder
+
+
+def flush_all():
+    """Run the scheduled flushes of all databases."""
+    for recorder in list(_recorders.values()):
+        recorder.flush_now()
+
+
+# the usage of the last interval is written when a worker is recycled or the
+# server is stopped, it is only lost when the process is killed
+atexit.register(flush_all)
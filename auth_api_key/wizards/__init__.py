@@ -0,0 +1 @@
+from . import auth_api_key_provision_wizard
@@ -0,0 +1,59 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import base64
+import csv
+import io
+
+from odoo import _, fields, models
+from odoo.exceptions import UserError
+
+
+class AuthApiKeyProvisionWizard(models.TransientModel):
+    _name = "auth.api.key.provision.wizard"
+    _description = "Provision Api Keys"
+
+    state = fields.Selection(
+        [("draft", "Draft"), ("done", "Done")], default="draft", required=True
+    )
+    data = fields.Text(
+        string="Api Keys",
+        help="""A CSV document with a name and a user column, or a JSON list
+        of objects with the same keys. The user is a login, a user_id column
+        can give the id of the user instead.""",
+    )
+    data_file = fields.Binary(string="File")
+    data_filename = fields.Char()
+    # only set as a default value of an unsaved wizard, so that the
+    # generated keys are not stored
+    result = fields.Text(
+        readonly=True,
+        help="The generated keys, which are not shown again.",
+    )
+
+    def _get_data(self):
+        self.ensure_one()
+        if self.data_file:
+            return base64.b64decode(self.data_file).decode("utf-8-sig")
+        return self.data
+
+    def action_provision(self):
+        self.ensure_one()
+        data = self._get_data()
+        if not data or not data.strip():
+            raise UserError(_("There are no api keys to provision."))
+        AuthApiKey = self.env["auth.api.key"]
+        api_keys = AuthApiKey._provision(AuthApiKey._parse_provision_data(data))
+        output = io.StringIO()
+        csv.writer(output).writerows(
+            [["name", "key"]] + [[api_key.name, api_key.key] for api_key in api_keys]
+        )
+        self.write({"data": False, "data_file": False})
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("Provisioned Api Keys"),
+            "res_model": self._name,
+            "view_mode": "form",
+            "target": "new",
+            "context": {"default_state": "done", "default_result": output.getvalue()},
+        }
@@ -1,2 +1,3 @@
 from . import auth_api_key
 from . import auth_api_key_group
+from . import ir_http
@@ -3,7 +3,10 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
-from odoo import fields, models
+import re
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
 
 
 class AuthApiKey(models.Model):
@@ -17,3 +20,55 @@ class AuthApiKey(models.Model):
         column2="group_id",
         string="Auth Groups",
     )
+
+    def _get_api_key_info(self):
+        api_key_id, uid, group_codes = super()._get_api_key_info()
+        return (
+            api_key_id,
+            uid,
+            group_codes | frozenset(self.auth_api_key_group_ids.mapped("code")),
+        )
+
+    def _prepare_rate_limits(self):
+        limits = super()._prepare_rate_limits()
+        for group in self.auth_api_key_group_ids:
+            limit = group._prepare_rate_limit(f"group:{group.id}")
+            if limit:
+                limits += (limit,)
+        return limits
+
+    @api.model
+    def _prepare_provision_vals_list(self, rows):
+        """Add the groups of the rows, given as a list of codes or as a string
+        of comma or space separated codes."""
+        vals_list = super()._prepare_provision_vals_list(rows)
+        codes_list = []
+        for row in rows:
+            codes = row.get("groups") or []
+            if isinstance(codes, str):
+                codes = re.split(r"[\s,]+", codes.strip())
+            codes_list.append({code for code in codes if code})
+        groups = {
+            group.code: group.id
+            for group in self.env["auth.api.key.group"].search(
+                [("code", "in", list(set().union(*codes_list)))]
+            )
+        }
+        for row, vals, codes in zip(rows, vals_list, codes_list):
+            unknown_codes = codes - groups.keys()
+            if unknown_codes:
+                raise UserError(
+                    _("Unknown groups %(codes)s for the api key %(name)s")
+                    % {"codes": ", ".join(sorted(unknown_codes)), "name": row["name"]}
+                )
+            vals["auth_api_key_group_ids"] = [(6, 0, [groups[code] for code in codes])]
+        return vals_list
+
+    @api.model
+    def _get_export_fields(self):
+        return super()._get_export_fields() + ["groups"]
+
+    def _get_export_values(self):
+        values = super()._get_export_values()
+        values["groups"] = " ".join(self.auth_api_key_group_ids.mapped("code"))
+        return values
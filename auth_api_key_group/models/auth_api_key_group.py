@@ -3,7 +3,7 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
-from odoo import fields, models
+from odoo import api, fields, models
 
 
 class AuthApiKeyGroup(models.Model):
@@ -21,3 +21,37 @@ class AuthApiKeyGroup(models.Model):
         column2="key_id",
         string="API Keys",
     )
+    rate_limit = fields.Float(
+        help="Requests per second allowed with all the keys of the group, "
+        "0 for no limit."
+    )
+    rate_limit_burst = fields.Integer(
+        string="Rate Limit Burst",
+        help="Requests that can be sent at once with the keys of the group, "
+        "before being limited to the rate limit. Defaults to the rate limit.",
+    )
+
+    def _prepare_rate_limit(self, name):
+        """Return the (name, rate, burst) limit of the group, if any."""
+        self.ensure_one()
+        if self.rate_limit <= 0:
+            return None
+        burst = self.rate_limit_burst or max(1, round(self.rate_limit))
+        return name, self.rate_limit, burst
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records.auth_api_key_ids._clear_key_cache()
+        return records
+
+    def write(self, vals):
+        api_keys = self.auth_api_key_ids
+        res = super().write(vals)
+        if {"code", "rate_limit", "rate_limit_burst", "auth_api_key_ids"} & vals.keys():
+            (api_keys | self.auth_api_key_ids)._clear_key_cache()
+        return res
+
+    def unlink(self):
+        self.auth_api_key_ids._clear_key_cache()
+        return super().unlink()
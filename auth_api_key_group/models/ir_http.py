@@ -0,0 +1,36 @@
+# Copyright 2021 Camptcamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from werkzeug.exceptions import Forbidden
+
+from odoo import models
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = "ir.http"
+
+    @classmethod
+    def _authenticate(cls, endpoint):
+        res = super()._authenticate(endpoint)
+        api_key_groups = endpoint.routing.get("api_key_groups")
+        if api_key_groups:
+            cls._check_api_key_groups(api_key_groups)
+        return res
+
+    @classmethod
+    def _check_api_key_groups(cls, api_key_groups):
+        """Only allow requests authenticated by a key of one of the groups
+        whose codes are api_key_groups."""
+        group_codes = getattr(request, "auth_api_key_groups", None)
+        if group_codes is None or group_codes.isdisjoint(api_key_groups):
+            _logger.info(
+                "Api key %s is not in any of the groups %s",
+                getattr(request, "auth_api_key_id", None),
+                api_key_groups,
+            )
+            raise Forbidden()
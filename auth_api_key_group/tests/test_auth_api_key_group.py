@@ -1,10 +1,17 @@
 # Copyright 2021 Camptcamp SA
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+import contextlib
+from unittest.mock import Mock
 
+from werkzeug.exceptions import Forbidden
 
+import odoo.http
+from odoo.exceptions import UserError
 from odoo.tests.common import TransactionCase
 
+from odoo.addons.auth_api_key.throttle import clear_stores
+
 
 class TestAuthApiKey(TransactionCase):
     @classmethod
@@ -37,6 +44,11 @@ class TestAuthApiKey(TransactionCase):
             }
         )
 
+    def setUp(self):
+        super().setUp()
+        # the caches of the api keys are kept in the worker memory
+        self.addCleanup(clear_stores, self.env.cr.dbname)
+
     def test_relations(self):
         self.assertIn(self.api_key_group1, self.api_key1.auth_api_key_group_ids)
         self.assertIn(self.api_key_group1, self.api_key2.auth_api_key_group_ids)
@@ -44,3 +56,73 @@ class TestAuthApiKey(TransactionCase):
         self.assertIn(self.api_key_group2, self.api_key3.auth_api_key_group_ids)
         self.assertNotIn(self.api_key_group2, self.api_key1.auth_api_key_group_ids)
         self.assertNotIn(self.api_key_group2, self.api_key1.auth_api_key_group_ids)
+
+    def test_rate_limits(self):
+        self.api_key1.rate_limit = 10
+        self.api_key_group1.write({"rate_limit": 5, "rate_limit_burst": 20})
+        self.assertEqual(
+            self.AuthApiKey._get_rate_limits(self.api_key1.id),
+            (
+                (f"key:{self.api_key1.id}", 10, 10),
+                (f"group:{self.api_key_group1.id}", 5, 20),
+            ),
+        )
+        self.assertEqual(
+            self.AuthApiKey._get_rate_limits(self.api_key2.id),
+            ((f"group:{self.api_key_group1.id}", 5, 20),),
+        )
+        self.api_key2.auth_api_key_group_ids = self.api_key_group2
+        self.assertEqual(self.AuthApiKey._get_rate_limits(self.api_key2.id), ())
+
+    def test_api_key_info(self):
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_info("one"),
+            (self.api_key1.id, self.demo_user.id, frozenset({"g-one"})),
+        )
+        self.api_key_group1.code = "g-one-renamed"
+        self.api_key1.auth_api_key_group_ids |= self.api_key_group2
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_info("one")[2],
+            frozenset({"g-one-renamed", "g-two"}),
+        )
+
+    @contextlib.contextmanager
+    def _mock_request(self, **attrs):
+        request = Mock(**attrs)
+        with contextlib.ExitStack() as s:
+            odoo.http._request_stack.push(request)
+            s.callback(odoo.http._request_stack.pop)
+            yield request
+
+    def test_check_api_key_groups(self):
+        group_codes = self.AuthApiKey._retrieve_api_key_info("three")[2]
+        IrHttp = self.env["ir.http"]
+        with self._mock_request(auth_api_key_groups=group_codes):
+            IrHttp._check_api_key_groups(["g-one", "g-two"])
+            with self.assertRaises(Forbidden):
+                IrHttp._check_api_key_groups(["g-one"])
+        with self._mock_request(auth_api_key_groups=None):
+            with self.assertRaises(Forbidden):
+                IrHttp._check_api_key_groups(["g-one"])
+
+    def test_provision(self):
+        api_keys = self.AuthApiKey._provision(
+            [
+                {"name": "Four", "user": "demo", "groups": "g-one, g-two"},
+                {"name": "Five", "user": "demo", "groups": ["g-two"]},
+                {"name": "Six", "user": "demo"},
+            ]
+        )
+        self.assertEqual(
+            api_keys[0].auth_api_key_group_ids,
+            self.api_key_group1 + self.api_key_group2,
+        )
+        self.assertEqual(api_keys[1].auth_api_key_group_ids, self.api_key_group2)
+        self.assertFalse(api_keys[2].auth_api_key_group_ids)
+        self.assertEqual(
+            api_keys[0]._get_export_values()["groups"].split(), ["g-one", "g-two"]
+        )
+        with self.assertRaises(UserError):
+            self.AuthApiKey._provision(
+                [{"name": "Seven", "user": "demo", "groups": "g-three"}]
+            )
@@ -11,7 +11,7 @@ This can be very useful to avoid mixing your keys between your various
 environments when restoring databases. All you have to do is to add a new
 section to your configuration file according to the following convention:
     """,
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.2.0",
     "development_status": "Alpha",
     "license": "LGPL-3",
     "website": "https://github.com/OCA/server-auth",
@@ -0,0 +1,28 @@
+# Copyright 2021 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+import psycopg2
+
+from odoo import SUPERUSER_ID, api
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    api_keys = env["auth.api.key"].search([])
+    # digests were computed by auth_api_key from the stored keys, recompute
+    # them now that keys may come from the server environment
+    api_keys.write({"key_digest": False})
+    for api_key in api_keys:
+        try:
+            with cr.savepoint():
+                api_key._update_key_digest()
+        except psycopg2.IntegrityError:
+            _logger.warning(
+                "Api key %s has the same key as another api key, it can not be "
+                "used before its key is changed.",
+                api_key.name,
+            )
@@ -0,0 +1,13 @@
+# Copyright 2021 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    # the keys sharing their digest with another key were not indexed while
+    # the digests were unique
+    env["auth.api.key"].with_context(active_test=False).search(
+        [("key_digest", "=", False)]
+    )._update_key_digest()
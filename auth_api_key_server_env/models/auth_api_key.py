@@ -3,8 +3,105 @@
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
 
-from odoo import models
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import config, consteq
+
+from odoo.addons.server_environment import serv_config, server_env
+
+_logger = logging.getLogger(__name__)
+
+# seconds between two checks of the modification of the configuration files
+CONFIG_CHECK_INTERVAL = 10
+
+
+def get_config_files():
+    """Return the configuration files the server environment is read from."""
+    files = []
+    env_dir = getattr(server_env, "_dir", None)
+    running_env = config.get("running_env")
+    if env_dir and running_env:
+        for folder in ("default", running_env):
+            path = os.path.join(env_dir, folder)
+            if os.path.isdir(path):
+                files.extend(
+                    os.path.join(path, name)
+                    for name in sorted(os.listdir(path))
+                    if name.endswith(".conf")
+                )
+    if config.rcfile:
+        files.append(config.rcfile)
+    return files
+
+
+def get_config_signature():
+    signature = []
+    for path in get_config_files():
+        try:
+            signature.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            continue
+    return tuple(signature)
+
+
+def update_config(config_p, source):
+    """Replace the sections and options of config_p with the ones of source.
+
+    config_p is updated in place, so that all the modules holding it, like
+    server.env.mixin, see the new configuration.
+    """
+    sections = {
+        section: dict(source.items(section, raw=True)) for section in source.sections()
+    }
+    defaults = dict(source.defaults())
+    for section in config_p.sections():
+        config_p.remove_section(section)
+    config_p.defaults().clear()
+    config_p.read_dict({config_p.default_section: defaults, **sections})
+
+
+class ServerEnvConfig:
+    """Reloads the server environment configuration, serv_config, when its
+    files are modified.
+    """
+
+    def __init__(self):
+        self.signature = get_config_signature()
+        self.checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Reload the configuration if its files were modified since it was
+        loaded, at most every CONFIG_CHECK_INTERVAL seconds.
+
+        Return True if it was reloaded.
+        """
+        now = time.monotonic()
+        if now - self.checked_at < CONFIG_CHECK_INTERVAL:
+            return False
+        with self._lock:
+            if now - self.checked_at < CONFIG_CHECK_INTERVAL:
+                return False
+            self.checked_at = now
+            signature = get_config_signature()
+            if signature == self.signature:
+                return False
+            _logger.info("Server environment configuration modified, reloading")
+            update_config(serv_config, server_env._load_config())
+            self.signature = signature
+            return True
+
+
+server_env_config = ServerEnvConfig()
+
+# (version, keys of the server environment by digest), by database
+_server_env_keys = {}
 
 
 class AuthApiKey(models.Model):
@@ -12,6 +109,14 @@ class AuthApiKey(models.Model):
     _name = "auth.api.key"
     _inherit = ["auth.api.key", "server.env.techname.mixin", "server.env.mixin"]
 
+    key_digest = fields.Char(index=True)
+
+    _sql_constraints = [
+        # the keys of the server environment are entered as placeholders,
+        # which share their digest: ambiguous digests match no key instead
+        ("key_digest_uniq", "CHECK(true)", "Api Key must be unique."),
+    ]
+
     def _server_env_section_name(self):
         """Name of the section in the configuration files
         We override the default implementation to keep the compatibility
@@ -28,3 +133,134 @@ class AuthApiKey(models.Model):
         api_key_fields = {"key": {}}
         api_key_fields.update(base_fields)
         return api_key_fields
+
+    def _get_indexed_key(self):
+        # keys from the server environment are looked up in memory, as the
+        # configuration files can change after the digest is stored
+        if self._server_env_has_key_defined("key"):
+            return False
+        return super()._get_indexed_key()
+
+    @api.model
+    def _get_indexed_key_from_vals(self, vals):
+        field_name = self._server_env_section_name_field
+        if self.new({field_name: vals.get(field_name)})._server_env_has_key_defined(
+            "key"
+        ):
+            return False
+        return super()._get_indexed_key_from_vals(vals)
+
+    @api.model
+    def _get_server_env_keys(self):
+        """Return the (api key id, key) of the keys defined in the server
+        environment, by digest.
+
+        They are loaded on first use, and kept in the worker memory until the
+        configuration files are reloaded or entries are dropped from the cache
+        of the valid keys, which happens in all workers when api keys are
+        changed.
+        """
+        cache = self._get_key_cache()
+        version = (server_env_config.signature, cache, cache.generation)
+        entry = _server_env_keys.get(self.env.cr.dbname)
+        if entry is None or entry[0] != version:
+            entry = _server_env_keys[self.env.cr.dbname] = (
+                version,
+                MappingProxyType(self._load_server_env_keys()),
+            )
+        return entry[1]
+
+    @api.model
+    def _load_server_env_keys(self):
+        keys = {}
+        for api_key in self.search([]):
+            section = api_key._server_env_section_name()
+            if serv_config.has_option(section, "key"):
+                key = serv_config.get(section, "key")
+                if key:
+                    keys[self._get_key_digest(key)] = (api_key.id, key)
+        return keys
+
+    @api.model
+    def _search_api_key_by_digest(self, digest):
+        api_keys = self.search([("key_digest", "=", digest)], limit=2)
+        return api_keys if len(api_keys) == 1 else self.browse()
+
+    @api.model
+    def _retrieve_api_key_info(self, key):
+        if server_env_config.check():
+            self._reset_server_env_keys()
+        return super()._retrieve_api_key_info(key)
+
+    @api.model
+    def _retrieve_api_key_info_from_signature(
+        self, api_key_id, timestamp, nonce, signature, message
+    ):
+        if server_env_config.check():
+            self._reset_server_env_keys()
+        return super()._retrieve_api_key_info_from_signature(
+            api_key_id, timestamp, nonce, signature, message
+        )
+
+    def _get_signing_key(self):
+        section = self._server_env_section_name()
+        if serv_config.has_option(section, "key"):
+            return serv_config.get(section, "key")
+        return super()._get_signing_key()
+
+    @api.model
+    def _lookup_api_key(self, key, digest):
+        api_key_id, env_key = self._get_server_env_keys().get(digest, (None, None))
+        if api_key_id:
+            if consteq(key, env_key):
+                return self.browse(api_key_id)
+            raise ValidationError(_("The key %s is not allowed") % key)
+        return super()._lookup_api_key(key, digest)
+
+    @api.model
+    def _reset_server_env_keys(self):
+        """Drop the keys of the server environment cached by this worker, once
+        the configuration files were reloaded."""
+        self._get_key_cache().clear()
+
+    def _register_hook(self):
+        res = super()._register_hook()
+        # resolve the keys of the server environment once, when the registry
+        # is loaded, rather than on the first request
+        self._get_server_env_keys()
+        return res
+
+    def _rotate(self, grace_period=None):
+        if any(record._server_env_has_key_defined("key") for record in self):
+            raise UserError(
+                _(
+                    "Keys defined in the server environment must be rotated in "
+                    "its configuration."
+                )
+            )
+        return super()._rotate(grace_period=grace_period)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        env_records = records.filtered(
+            lambda record: record._server_env_has_key_defined("key")
+        )
+        if env_records:
+            # the section of the created records may differ from the one
+            # found from their values
+            env_records.filtered("key_digest")._update_key_digest()
+            env_records._clear_key_cache()
+        else:
+            # the server environment can also be changed in memory, reload
+            # the index of this worker on next use
+            _server_env_keys.pop(self.env.cr.dbname, None)
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "tech_name" in vals:
+            # the section of the keys in the server environment changed
+            self._update_key_digest()
+            self._clear_key_cache()
+        return res
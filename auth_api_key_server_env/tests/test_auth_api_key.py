@@ -2,10 +2,22 @@
 # Copyright 2021 Camptocamp SA
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+import logging
+import time
+from configparser import ConfigParser
+from unittest.mock import patch
+
 from odoo.exceptions import ValidationError
-from odoo.tests.common import TransactionCase
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.auth_api_key.signature import get_signed_message, sign
+from odoo.addons.auth_api_key.throttle import clear_stores
+from odoo.addons.server_environment import serv_config, server_env
+
+from ..models import auth_api_key
+from ..models.auth_api_key import server_env_config
 
-from odoo.addons.server_environment import serv_config
+_logger = logging.getLogger(__name__)
 
 
 class TestAuthApiKey(TransactionCase):
@@ -26,6 +38,11 @@ class TestAuthApiKey(TransactionCase):
         serv_config.add_section("api_key_test_env")
         serv_config.set("api_key_test_env", "key", "api_key_from_env")
 
+    def setUp(self):
+        super().setUp()
+        # the caches of the api keys are kept in the worker memory
+        self.addCleanup(clear_stores, self.env.cr.dbname)
+
     def test_lookup_key_from_env(self):
         self.assertEqual(
             self.env["auth.api.key"]._retrieve_uid_from_api_key("api_key_from_env"),
@@ -35,3 +52,160 @@ class TestAuthApiKey(TransactionCase):
             # dummy key must be replace with the one from env and
             # therefore should be unusable
             self.env["auth.api.key"]._retrieve_uid_from_api_key("dummy")
+
+    def test_reload_modified_config(self):
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("api_key_from_env"),
+            self.api_key_from_env.id,
+        )
+        config_p = ConfigParser()
+        config_p.add_section("api_key_test_env")
+        config_p.set("api_key_test_env", "key", "api_key_modified")
+        saved_config = ConfigParser(interpolation=None)
+        auth_api_key.update_config(saved_config, serv_config)
+        self.addCleanup(auth_api_key.update_config, serv_config, saved_config)
+        self.addCleanup(
+            vars(server_env_config).update, signature=server_env_config.signature
+        )
+        server_env_config.checked_at = 0
+        with patch.object(
+            auth_api_key, "get_config_signature", return_value=(("new.conf", 1),)
+        ), patch.object(server_env, "_load_config", return_value=config_p):
+            self.assertEqual(
+                self.AuthApiKey._retrieve_api_key_id("api_key_modified"),
+                self.api_key_from_env.id,
+            )
+            with self.assertRaises(ValidationError):
+                self.AuthApiKey._retrieve_api_key_id("api_key_from_env")
+        # the fields of the server environment are read from the same
+        # configuration
+        self.api_key_from_env.invalidate_recordset(["key"])
+        self.assertEqual(self.api_key_from_env.key, "api_key_modified")
+
+    def test_env_keys_not_indexed(self):
+        serv_config.add_section("api_key_test_env2")
+        self.addCleanup(serv_config.remove_section, "api_key_test_env2")
+        serv_config.set("api_key_test_env2", "key", "api_key_from_env2")
+        # both keys are dummy values, which must not collide in the index
+        api_key = self.AuthApiKey.create(
+            {
+                "name": "From Env 2",
+                "key": "dummy",
+                "user_id": self.demo_user.id,
+                "tech_name": "test_env2",
+            }
+        )
+        self.assertFalse(api_key.key_digest)
+        self.assertEqual(
+            self.env["auth.api.key"]._retrieve_api_key_id("api_key_from_env2"),
+            api_key.id,
+        )
+
+    def test_placeholder_keys(self):
+        # the keys can be created before they are added to the configuration
+        api_keys = self.AuthApiKey.create(
+            [
+                {
+                    "name": f"Placeholder {i}",
+                    "key": "dummy",
+                    "user_id": self.demo_user.id,
+                    "tech_name": f"test_placeholder_{i}",
+                }
+                for i in range(2)
+            ]
+        )
+        for i in range(2):
+            section = f"api_key_test_placeholder_{i}"
+            serv_config.add_section(section)
+            self.addCleanup(serv_config.remove_section, section)
+            serv_config.set(section, "key", f"placeholder_key_{i}")
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("placeholder_key_1"), api_keys[1].id
+        )
+        # the placeholder is ambiguous
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_id("dummy")
+
+    def test_signed_request(self):
+        timestamp = int(time.time())
+        message = get_signed_message(timestamp, "n1", "GET", "/my_service", b"")
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_info_from_signature(
+                self.api_key_from_env.id,
+                timestamp,
+                "n1",
+                sign(b"api_key_from_env", message),
+                message,
+            )[0],
+            self.api_key_from_env.id,
+        )
+        message = get_signed_message(timestamp, "n2", "GET", "/my_service", b"")
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_api_key_info_from_signature(
+                self.api_key_from_env.id,
+                timestamp,
+                "n2",
+                sign(b"dummy", message),
+                message,
+            )
+
+
+@tagged("post_install", "-at_install", "-standard", "auth_api_key_benchmark")
+class TestBenchmark(TransactionCase):
+    """Resolution of keys with 1,000 keys defined in the server environment.
+
+    Run it with ``--test-tags auth_api_key_benchmark``.
+    """
+
+    @classmethod
+    def setUpClass(cls, *args, **kwargs):
+        super().setUpClass(*args, **kwargs)
+        cls.AuthApiKey = cls.env["auth.api.key"]
+        cls.count = 1000
+        cls.api_keys = cls.AuthApiKey.create(
+            [
+                {
+                    "name": f"Benchmark {i}",
+                    "key": "dummy",
+                    "user_id": cls.env.ref("base.user_demo").id,
+                    "tech_name": f"benchmark_{i}",
+                }
+                for i in range(cls.count)
+            ]
+        )
+        for i in range(cls.count):
+            section = f"api_key_benchmark_{i}"
+            serv_config.add_section(section)
+            serv_config.set(section, "key", f"benchmark_key_{i}")
+            cls.addClassCleanup(serv_config.remove_section, section)
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(clear_stores, self.env.cr.dbname)
+
+    def test_cold_and_warm(self):
+        self.AuthApiKey._reset_server_env_keys()
+        start = time.perf_counter()
+        queries = self.cr.sql_log_count
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key_id("benchmark_key_0"),
+            self.api_keys[0].id,
+        )
+        cold = time.perf_counter() - start
+        cold_queries = self.cr.sql_log_count - queries
+        for i in range(self.count):
+            self.AuthApiKey._retrieve_api_key_id(f"benchmark_key_{i}")
+        start = time.perf_counter()
+        # a warm lookup only reads the invalidations of the key cache
+        with self.assertQueryCount(self.count):
+            for i in range(self.count):
+                self.AuthApiKey._retrieve_api_key_id(f"benchmark_key_{i}")
+        warm = (time.perf_counter() - start) / self.count
+        _logger.info(
+            "Resolution of a key among %d keys of the server environment: "
+            "cold %.1f ms (%d queries), warm %.1f us (1 query)",
+            self.count,
+            cold * 1000,
+            cold_queries,
+            warm * 1000000,
+        )
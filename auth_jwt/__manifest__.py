@@ -5,13 +5,18 @@
     "name": "Auth JWT",
     "summary": """
         JWT bearer token authentication.""",
-    "version": "16.0.1.1.0",
+    "version": "16.0.1.2.0",
     "license": "LGPL-3",
     "author": "ACSONE SA/NV,Odoo Community Association (OCA)",
     "maintainers": ["sbidoul"],
     "website": "https://github.com/OCA/server-auth",
     "depends": [],
     "external_dependencies": {"python": ["pyjwt", "cryptography"]},
-    "data": ["security/ir.model.access.csv", "views/auth_jwt_validator_views.xml"],
+    "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
+        "views/auth_jwt_validator_views.xml",
+        "views/auth_jwt_revoked_token_views.xml",
+    ],
     "demo": [],
 }
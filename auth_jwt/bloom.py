@@ -0,0 +1,42 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Immutable, compact set of strings.
+
+    Membership tests may return false positives, at about error_rate, but
+    never false negatives.
+    """
+
+    def __init__(self, values, error_rate=0.01):
+        values = list(values)
+        count = max(len(values), 1)
+        self._len = len(values)
+        self._size = max(8, int(-count * math.log(error_rate) / math.log(2) ** 2))
+        self._hash_count = max(1, round(self._size / count * math.log(2)))
+        bits = bytearray((self._size + 7) // 8)
+        for value in values:
+            for position in self._positions(value):
+                bits[position >> 3] |= 1 << (position & 7)
+        self._bits = bytes(bits)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, value):
+        if not self._len:
+            return False
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % self._size for i in range(self._hash_count)]
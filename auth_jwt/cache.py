@@ -0,0 +1,87 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire at a given time.
+
+    It keeps at most max_size entries, and counts hits and misses.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, expires_at):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(dbname, snapshot, name, factory, *args):
+    """Return the store name of the validator of snapshot in the worker for
+    dbname, made by factory(*args).
+
+    Stores are kept per database in the worker memory rather than in the
+    registry cache, so that clearing the registry cache does not reset them.
+    A store is made again when the snapshot of its validator changes, so that
+    every worker resets it once the validator is modified.
+    """
+    key = (dbname, snapshot.id, name)
+    store = _stores.get(key)
+    if store is None or (store[0] is not snapshot and store[0] != snapshot):
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None or store[0] != snapshot:
+                store = _stores[key] = (snapshot, factory(*args))
+            else:
+                # same configuration, keep the store
+                store = _stores[key] = (snapshot, store[1])
+    return store[1]
+
+
+def clear_stores(dbname, validator_ids=None):
+    """Drop the stores of the worker for dbname, or only those of validator_ids."""
+    with _stores_lock:
+        for key in list(_stores):
+            if key[0] == dbname and (validator_ids is None or key[1] in validator_ids):
+                del _stores[key]
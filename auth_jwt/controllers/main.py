@@ -0,0 +1,49 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from werkzeug.exceptions import NotFound
+
+from odoo.http import Controller, Response, request, route
+from odoo.tools import consteq
+
+from ..metrics import metrics
+
+METRICS_TOKEN_PARAM = "auth_jwt.metrics_token"
+
+
+class AuthJwtMetricsController(Controller):
+    @route(
+        "/auth_jwt/metrics",
+        type="http",
+        auth="none",
+        csrf=False,
+        save_session=False,
+        methods=["GET"],
+    )
+    def prometheus_metrics(self):
+        token = request.env["ir.config_parameter"].sudo().get_param(METRICS_TOKEN_PARAM)
+        if not token:
+            raise NotFound()
+        authorization = request.httprequest.headers.get("Authorization") or ""
+        if not consteq(authorization, f"Bearer {token}"):
+            return Response(
+                "Unauthorized",
+                status=401,
+                headers=[("WWW-Authenticate", "Bearer")],
+            )
+        return Response(
+            metrics.render(self._get_cache_counters()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+            status=200,
+        )
+
+    def _get_cache_counters(self):
+        Validator = request.env["auth.jwt.validator"].sudo()
+        for snapshot in Validator._get_snapshots()[0].values():
+            for cache_name in ("token", "partner", "user"):
+                cache = Validator._get_snapshot_cache(snapshot, cache_name)
+                if cache is None:
+                    continue
+                labels = dict(validator=snapshot.name, cache=cache_name)
+                yield "auth_jwt_cache_hits_total", labels, cache.hits
+                yield "auth_jwt_cache_misses_total", labels, cache.misses
@@ -32,10 +32,18 @@ class UnauthorizedInvalidToken(Unauthorized):
     pass
 
 
+class UnauthorizedRevokedToken(Unauthorized):
+    pass
+
+
 class UnauthorizedPartnerNotFound(Unauthorized):
     pass
 
 
+class UnauthorizedUserNotFound(Unauthorized):
+    pass
+
+
 class UnauthorizedCompositeJwtError(Unauthorized):
     """Indicate that multiple errors occurred during JWT chain validation."""
 
@@ -0,0 +1,181 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import json
+import logging
+import re
+import threading
+import time
+import urllib.request
+
+import jwt  # pylint: disable=missing-manifest-dependency
+
+from .metrics import metrics
+
+_logger = logging.getLogger(__name__)
+
+MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class JwksKeyNotFound(KeyError):
+    pass
+
+
+class _JwksEntry:
+    def __init__(self, uri):
+        self.uri = uri
+        self.keys = None
+        self.fetched_at = 0.0
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def lookup(self, kid):
+        if not self.keys:
+            return None
+        if kid is None and len(self.keys) == 1:
+            return next(iter(self.keys.values()))
+        return self.keys.get(kid)
+
+
+class JwksStore:
+    """Process-wide cache of the signing keys published at JWKS URIs.
+
+    All keys of a JWKS document are parsed in one fetch and kept until the
+    TTL announced by the Cache-Control header (or default_ttl) expires. Expired
+    keys keep being served while a background thread refreshes them. An
+    unknown kid triggers at most one synchronous refresh per
+    min_refresh_interval, and concurrent refreshes of the same URI are
+    collapsed into a single fetch.
+
+    Local files are supported, either as absolute paths or file:// URIs.
+    """
+
+    def __init__(self, default_ttl=3600, max_ttl=86400, min_refresh_interval=30):
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = 10
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _get_entry(self, uri):
+        entry = self._entries.get(uri)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.setdefault(uri, _JwksEntry(uri))
+        return entry
+
+    def get_key(self, uri, kid):
+        """Return the signing key for kid.
+
+        Raise JwksKeyNotFound if the JWKS does not contain it, even after a
+        refresh.
+        """
+        entry = self._get_entry(uri)
+        if entry.keys is None:
+            self._refresh(entry)
+        key = entry.lookup(kid)
+        now = time.monotonic()
+        if key is not None:
+            if now >= entry.expires_at:
+                self._refresh_in_background(entry)
+            return key
+        if now - entry.fetched_at >= self.min_refresh_interval:
+            _logger.info("Key %r not found in JWKS %s, refreshing", kid, uri)
+            self._refresh(entry)
+            key = entry.lookup(kid)
+        if key is None:
+            raise JwksKeyNotFound(f"Key {kid!r} not found in JWKS {uri}")
+        return key
+
+    def has_key(self, uri, kid):
+        """Tell if kid is among the keys already fetched from uri."""
+        entry = self._entries.get(uri)
+        return entry is not None and entry.lookup(kid) is not None
+
+    def clear(self, uri=None):
+        with self._lock:
+            if uri is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(uri, None)
+
+    def _refresh(self, entry):
+        fetched_at = entry.fetched_at
+        with entry.lock:
+            if entry.fetched_at != fetched_at:
+                # another thread refreshed the keys while we were waiting
+                return
+            try:
+                entry.keys, ttl = self._fetch(entry.uri)
+            except Exception:
+                metrics.inc(
+                    "auth_jwt_jwks_fetches_total", uri=entry.uri, result="error"
+                )
+                if entry.keys is None:
+                    raise
+                _logger.exception("Could not refresh JWKS %s", entry.uri)
+                # keep serving the stale keys, and retry later
+                ttl = self.min_refresh_interval
+            else:
+                metrics.inc(
+                    "auth_jwt_jwks_fetches_total", uri=entry.uri, result="success"
+                )
+            entry.fetched_at = time.monotonic()
+            entry.expires_at = entry.fetched_at + ttl
+
+    def _refresh_in_background(self, entry):
+        if entry.refreshing:
+            return
+        entry.refreshing = True
+
+        def target():
+            try:
+                self._refresh(entry)
+            except Exception:  # pylint: disable=broad-except
+                _logger.exception("Could not refresh JWKS %s", entry.uri)
+            finally:
+                entry.refreshing = False
+
+        threading.Thread(
+            target=target, name=f"jwks-refresh-{entry.uri}", daemon=True
+        ).start()
+
+    def _fetch(self, uri):
+        """Fetch and parse a JWKS document, return (keys by kid, ttl)."""
+        if uri.startswith("/"):
+            with open(uri, "rb") as f:
+                data = f.read()
+            cache_control = None
+        else:
+            with urllib.request.urlopen(uri, timeout=self.timeout) as response:
+                data = response.read()
+                cache_control = response.headers.get("Cache-Control")
+        return self._parse_keys(json.loads(data)), self._get_ttl(cache_control)
+
+    def _get_ttl(self, cache_control):
+        ttl = self.default_ttl
+        if cache_control:
+            mo = MAX_AGE_RE.search(cache_control)
+            if mo:
+                ttl = int(mo.group(1))
+            elif "no-cache" in cache_control or "no-store" in cache_control:
+                ttl = 0
+        return max(self.min_refresh_interval, min(ttl, self.max_ttl))
+
+    def _parse_keys(self, jwks):
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if jwk.get("use", "sig") != "sig":
+                continue
+            try:
+                key = jwt.PyJWK(jwk)
+            except jwt.PyJWKError as e:
+                _logger.debug("Ignoring unusable JWK %r: %s", jwk.get("kid"), e)
+                continue
+            keys[key.key_id] = key.key
+        return keys
+
+
+jwks_store = JwksStore()
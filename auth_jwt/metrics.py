@@ -0,0 +1,137 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+METRICS_HELP = {
+    "auth_jwt_requests_total": "Requests authenticated by JWT, by result.",
+    "auth_jwt_request_duration_seconds": "Duration of JWT authentication.",
+    "auth_jwt_decode_duration_seconds": "Duration of token validation.",
+    "auth_jwt_failures_total": "Token validation failures, by exception class.",
+    "auth_jwt_chain_depth_total": "Successful authentications, by position of the "
+    "validator that accepted the token in the chain.",
+    "auth_jwt_jwks_fetches_total": "Fetches of JWKS documents.",
+    "auth_jwt_cache_hits_total": "Cache hits, by cache.",
+    "auth_jwt_cache_misses_total": "Cache misses, by cache.",
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"'
+        % (
+            name,
+            str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"),
+        )
+        for name, value in labels
+    )
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metrics:
+    """Thread-safe, in-process counters and histograms.
+
+    Each worker process has its own metrics, which are identified by a pid
+    label when rendered.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0, 0]
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def get(self, name, **labels):
+        """Return the value of a counter, or the count of a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][2]
+            return self._counters.get(key, 0)
+
+    def render(self, extra_counters=()):
+        """Render all metrics in the Prometheus text exposition format.
+
+        extra_counters is an iterable of (name, labels dict, value) for
+        counters that are collected at render time.
+        """
+        pid = ("pid", str(os.getpid()))
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self._histograms.items()
+            }
+        for name, labels, value in extra_counters:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        samples = {}
+        for (name, labels), value in sorted(counters.items()):
+            samples.setdefault((name, "counter"), []).append(
+                f"{name}{_format_labels(labels + (pid,))} {_format_value(value)}"
+            )
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            lines = samples.setdefault((name, "histogram"), [])
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts + [0]):
+                cumulative = count if math.isinf(bound) else cumulative + bucket_count
+                bucket_labels = labels + (pid, ("le", _format_value(bound)))
+                lines.append(
+                    f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels + (pid,))} {total!r}")
+            lines.append(f"{name}_count{_format_labels(labels + (pid,))} {count}")
+        output = []
+        for (name, metric_type), lines in sorted(samples.items()):
+            if name in METRICS_HELP:
+                output.append(f"# HELP {name} {METRICS_HELP[name]}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
+
+
+metrics = Metrics()
@@ -1,2 +1,5 @@
 from . import auth_jwt_validator
+from . import auth_jwt_revoked_token
 from . import ir_http
+from . import res_partner
+from . import res_users
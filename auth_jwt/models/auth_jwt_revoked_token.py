@@ -0,0 +1,80 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import datetime
+
+from odoo import api, fields, models, tools
+
+from ..bloom import BloomFilter
+
+
+class AuthJwtRevokedToken(models.Model):
+    _name = "auth.jwt.revoked.token"
+    _description = "Revoked JWT"
+    _rec_name = "jti"
+    _order = "exp desc"
+
+    jti = fields.Char(
+        string="JWT ID", required=True, help="jti claim of the revoked token."
+    )
+    exp = fields.Datetime(
+        string="Expiration",
+        required=True,
+        index=True,
+        help="Expiration of the revoked token, after which the revocation "
+        "is not needed anymore.",
+    )
+
+    _sql_constraints = [
+        ("jti_uniq", "unique(jti)", "This token is already revoked."),
+    ]
+
+    @api.model
+    @tools.ormcache()
+    def _get_revoked_filter(self):
+        """Return a filter of the jti of all revoked tokens.
+
+        It is cached in the registry, and rebuilt in all workers whenever
+        revocations change.
+        """
+        revoked_tokens = self.sudo().search_read(
+            [("exp", ">", fields.Datetime.now())], ["jti"]
+        )
+        return BloomFilter(revoked_token["jti"] for revoked_token in revoked_tokens)
+
+    @api.model
+    def _is_revoked(self, jti):
+        if jti not in self._get_revoked_filter():
+            return False
+        # the filter can have false positives
+        return bool(self.sudo().search([("jti", "=", jti)], limit=1))
+
+    @api.model
+    def _revoke(self, payload):
+        """Revoke the token whose payload is given."""
+        return self.create(
+            {
+                "jti": payload["jti"],
+                "exp": datetime.datetime.utcfromtimestamp(payload["exp"]),
+            }
+        )
+
+    @api.model
+    def _cron_prune(self):
+        self.search([("exp", "<", fields.Datetime.now())]).unlink()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.clear_caches()
+        return res
@@ -4,16 +4,19 @@
 import datetime
 import logging
 import re
+import time
 from calendar import timegm
+from dataclasses import dataclass
 from functools import partial
+from types import MappingProxyType
 
 import jwt  # pylint: disable=missing-manifest-dependency
-from jwt import PyJWKClient
 from werkzeug.exceptions import InternalServerError
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
 
+from ..cache import TTLCache, clear_stores, get_store
 from ..exceptions import (
     AmbiguousJwtValidator,
     ConfigurationError,
@@ -22,11 +25,71 @@ from ..exceptions import (
     UnauthorizedMalformedAuthorizationHeader,
     UnauthorizedMissingAuthorizationHeader,
     UnauthorizedPartnerNotFound,
+    UnauthorizedRevokedToken,
+    UnauthorizedUserNotFound,
 )
+from ..jwks import JwksKeyNotFound, jwks_store
+from ..metrics import metrics
+from ..token_cache import TokenCache
 
 _logger = logging.getLogger(__name__)
 
 AUTHORIZATION_RE = re.compile(r"^Bearer ([^ ]+)$")
+MISSING = object()
+# sequence incremented when users or partners matched by the validators change,
+# as base_cache_signaling is for the registry cache
+IDENTITY_CACHE_SIGNALING = "auth_jwt_identity_cache_signaling"
+
+# last value of IDENTITY_CACHE_SIGNALING seen by the worker, by database
+_identity_cache_versions = {}
+
+
+@dataclass(frozen=True)
+class JwtValidatorSnapshot:
+    """Immutable copy of the configuration of a JWT validator.
+
+    Snapshots are built once per registry and shared by all requests, so the
+    authentication hot path does not need to search or read validator records.
+    The caches of the validator are kept out of the snapshot, see
+    _get_snapshot_cache.
+    """
+
+    id: int
+    name: str
+    signature_type: str
+    secret_key: str
+    algorithm: str
+    public_key_jwk_uri: str
+    audience: tuple
+    issuer: str
+    user_id_strategy: str
+    static_user_id: int
+    user_id_claim: str
+    user_jit_provisioning: bool
+    partner_id_strategy: str
+    partner_id_claim: str
+    partner_id_required: bool
+    user_cache_size: int
+    user_cache_ttl: int
+    partner_cache_size: int
+    partner_cache_ttl: int
+    partner_cache_negative_ttl: int
+    cookie_enabled: bool
+    cookie_name: str
+    cookie_path: str
+    cookie_max_age: int
+    cookie_secure: bool
+    cookie_sliding_renewal: bool
+    cookie_renewal_fraction: float
+    token_cache_enabled: bool
+    token_cache_size: int
+    token_cache_max_age: int
+    # database.secret, used to sign cookies
+    cookie_secret: str
+    # ids of this validator followed by its next validators, in order
+    chain: tuple
+    # ids of the validators of the chain, by issuer
+    chain_by_issuer: MappingProxyType
 
 
 class AuthJwtValidator(models.Model):
@@ -47,7 +110,10 @@ class AuthJwtValidator(models.Model):
         ],
         default="HS256",
     )
-    public_key_jwk_uri = fields.Char()
+    public_key_jwk_uri = fields.Char(
+        help="URL of the JWKS publishing the signing keys. A file:// URI or an "
+        "absolute path to a local JWKS file can also be used."
+    )
     public_key_algorithm = fields.Selection(
         [
             # https://pyjwt.readthedocs.io/en/stable/algorithms.html
@@ -69,11 +135,53 @@ class AuthJwtValidator(models.Model):
     )
     issuer = fields.Char(required=True, help="To validate iss.")
     user_id_strategy = fields.Selection(
-        [("static", "Static")], required=True, default="static"
+        [
+            ("static", "Static"),
+            ("email", "From email claim, matching the user login"),
+            ("claim", "From claim, matching the user JWT Subject"),
+        ],
+        required=True,
+        default="static",
     )
     static_user_id = fields.Many2one("res.users", default=1)
-    partner_id_strategy = fields.Selection([("email", "From email claim")])
+    user_id_claim = fields.Char(
+        default="sub", help="Name of the claim holding the JWT Subject of the user."
+    )
+    user_jit_provisioning = fields.Boolean(
+        string="Create Users",
+        help="Create a portal user when no user matches the token.",
+    )
+    user_cache_size = fields.Integer(
+        default=1000,
+        help="Maximum number of resolved users cached per worker. "
+        "Set to 0 to disable the cache.",
+    )
+    user_cache_ttl = fields.Integer(
+        default=3600, help="Number of seconds a resolved user is cached."
+    )
+    partner_id_strategy = fields.Selection(
+        [
+            ("email", "From email claim"),
+            ("claim", "From claim, matching the partner JWT External ID"),
+        ]
+    )
+    partner_id_claim = fields.Char(
+        default="sub",
+        help="Name of the claim holding the JWT External ID of the partner.",
+    )
     partner_id_required = fields.Boolean()
+    partner_cache_size = fields.Integer(
+        default=1000,
+        help="Maximum number of resolved partners cached per worker. "
+        "Set to 0 to disable the cache.",
+    )
+    partner_cache_ttl = fields.Integer(
+        default=3600, help="Number of seconds a resolved partner is cached."
+    )
+    partner_cache_negative_ttl = fields.Integer(
+        default=60,
+        help="Number of seconds a claim value matching no partner is cached.",
+    )
 
     next_validator_id = fields.Many2one(
         "auth.jwt.validator",
@@ -97,11 +205,44 @@ class AuthJwtValidator(models.Model):
     cookie_secure = fields.Boolean(
         default=True, help="Set to false only for development without https."
     )
+    cookie_sliding_renewal = fields.Boolean(
+        help="Re-issue the cookie only when its remaining lifetime is below "
+        "the renewal fraction of its max age, instead of on every request."
+    )
+    cookie_renewal_fraction = fields.Float(
+        default=0.5,
+        help="Fraction of the cookie max age below which the cookie is re-issued.",
+    )
+    token_cache_enabled = fields.Boolean(
+        help="Keep the payload of verified tokens in memory, so that requests "
+        "reusing a token skip the signature verification."
+    )
+    token_cache_max_age = fields.Integer(
+        default=300,
+        help="Maximum number of seconds a verified token is cached. "
+        "Tokens are never cached beyond their expiration.",
+    )
+    token_cache_size = fields.Integer(
+        default=1000, help="Maximum number of verified tokens cached per worker."
+    )
 
     _sql_constraints = [
         ("name_uniq", "unique(name)", "JWT validator names must be unique !"),
     ]
 
+    def init(self):
+        self.env.cr.execute(
+            "SELECT 1 FROM pg_class WHERE relkind = 'S' AND relname = %s",
+            (IDENTITY_CACHE_SIGNALING,),
+        )
+        if not self.env.cr.fetchone():
+            self.env.cr.execute(  # pylint: disable=sql-injection
+                f"CREATE SEQUENCE {IDENTITY_CACHE_SIGNALING}"
+            )
+            self.env.cr.execute(  # pylint: disable=sql-injection
+                f"SELECT nextval('{IDENTITY_CACHE_SIGNALING}')"
+            )
+
     @api.constrains("name")
     def _check_name(self):
         for rec in self:
@@ -138,6 +279,113 @@ class AuthJwtValidator(models.Model):
                     % (rec.name,)
                 )
 
+    def _prepare_snapshot(self):
+        self.ensure_one()
+        chain = []
+        chain_by_issuer = {}
+        validator = self
+        while validator:
+            chain.append(validator.id)
+            chain_by_issuer.setdefault(validator.issuer, []).append(validator.id)
+            validator = validator.next_validator_id
+        if self.signature_type == "secret":
+            algorithm = self.secret_algorithm
+        else:
+            algorithm = self.public_key_algorithm
+        cookie_secret = None
+        if self.cookie_enabled:
+            ICP = self.env["ir.config_parameter"].sudo()
+            cookie_secret = ICP.get_param("database.secret")
+        return JwtValidatorSnapshot(
+            id=self.id,
+            name=self.name,
+            signature_type=self.signature_type,
+            secret_key=self.secret_key,
+            algorithm=algorithm,
+            public_key_jwk_uri=self.public_key_jwk_uri,
+            audience=tuple((self.audience or "").split(",")),
+            issuer=self.issuer,
+            user_id_strategy=self.user_id_strategy,
+            static_user_id=self.static_user_id.id,
+            user_id_claim=self.user_id_claim,
+            user_jit_provisioning=self.user_jit_provisioning,
+            partner_id_strategy=self.partner_id_strategy,
+            partner_id_claim=self.partner_id_claim,
+            partner_id_required=self.partner_id_required,
+            user_cache_size=self.user_cache_size,
+            user_cache_ttl=self.user_cache_ttl,
+            partner_cache_size=self.partner_cache_size,
+            partner_cache_ttl=self.partner_cache_ttl,
+            partner_cache_negative_ttl=self.partner_cache_negative_ttl,
+            cookie_enabled=self.cookie_enabled,
+            cookie_name=self.cookie_name,
+            cookie_path=self.cookie_path,
+            cookie_max_age=self.cookie_max_age,
+            cookie_secure=self.cookie_secure,
+            cookie_sliding_renewal=self.cookie_sliding_renewal,
+            cookie_renewal_fraction=self.cookie_renewal_fraction,
+            token_cache_enabled=self.token_cache_enabled,
+            token_cache_size=self.token_cache_size,
+            token_cache_max_age=self.token_cache_max_age,
+            cookie_secret=cookie_secret,
+            chain=tuple(chain),
+            chain_by_issuer=MappingProxyType(
+                {issuer: tuple(ids) for issuer, ids in chain_by_issuer.items()}
+            ),
+        )
+
+    @api.model
+    @tools.ormcache()
+    def _get_snapshots(self):
+        """Return snapshots of all validators, indexed by id and by name.
+
+        The result is cached in the registry. Any change to a validator
+        clears the registry cache, which is signaled to the other workers.
+        """
+        snapshots = [rec._prepare_snapshot() for rec in self.sudo().search([])]
+        return (
+            MappingProxyType({snapshot.id: snapshot for snapshot in snapshots}),
+            MappingProxyType({snapshot.name: snapshot for snapshot in snapshots}),
+        )
+
+    def _get_snapshot(self):
+        self.ensure_one()
+        return self._get_snapshots()[0][self.id]
+
+    @api.model
+    def _get_snapshot_cache(self, snapshot, cache_name):
+        """Return the "token", "partner" or "user" cache of the validator of
+        snapshot in the current worker, or None if it is disabled.
+
+        The caches are kept in the worker memory rather than in the snapshots,
+        so that they survive unrelated clears of the registry cache. They are
+        reset when the validator is modified.
+        """
+        dbname = self.env.cr.dbname
+        if cache_name == "token":
+            if not snapshot.token_cache_enabled:
+                return None
+            return get_store(
+                dbname,
+                snapshot,
+                cache_name,
+                TokenCache,
+                snapshot.token_cache_size,
+                snapshot.token_cache_max_age,
+            )
+        if cache_name == "partner":
+            enabled = snapshot.partner_id_strategy
+            size = snapshot.partner_cache_size
+        else:
+            enabled = snapshot.user_id_strategy != "static"
+            size = snapshot.user_cache_size
+        if not enabled or size <= 0:
+            return None
+        return get_store(dbname, snapshot, cache_name, TTLCache, size)
+
+    def _get_cache(self, cache_name):
+        return self._get_snapshot_cache(self._get_snapshot(), cache_name)
+
     @api.model
     def _get_validator_by_name_domain(self, validator_name):
         if validator_name:
@@ -145,8 +393,68 @@ class AuthJwtValidator(models.Model):
         return []
 
     @api.model
-    def _get_validator_by_name(self, validator_name):
+    def _get_snapshot_by_name(self, validator_name):
         domain = self._get_validator_by_name_domain(validator_name)
+        if domain != AuthJwtValidator._get_validator_by_name_domain(
+            self, validator_name
+        ):
+            # the lookup domain is customized, it can't be served by the
+            # snapshots indexed by name
+            return self._search_validator(domain, validator_name)._get_snapshot()
+        snapshots_by_name = self._get_snapshots()[1]
+        if validator_name:
+            snapshot = snapshots_by_name.get(validator_name)
+        elif len(snapshots_by_name) > 1:
+            _logger.error(
+                "More than one JWT validator found for name %r", validator_name
+            )
+            raise AmbiguousJwtValidator()
+        else:
+            snapshot = next(iter(snapshots_by_name.values()), None)
+        if not snapshot:
+            _logger.error("JWT validator not found for name %r", validator_name)
+            raise JwtValidatorNotFound()
+        return snapshot
+
+    @api.model
+    def _dispatch_chain(self, snapshot, token):
+        """Return the ids of the validators of a chain, in the order they
+        should be tried to validate token.
+
+        Validators expecting the issuer of the token, and public key validators
+        whose JWKS is known to hold the token key id, are tried first. The
+        other validators follow in chain order.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+            payload = jwt.decode(token, options={"verify_signature": False})
+        except jwt.PyJWTError:
+            return snapshot.chain
+        # the token is not verified yet, its claims may have any type
+        issuer = payload.get("iss")
+        kid = header.get("kid")
+        by_issuer = ()
+        if isinstance(issuer, str):
+            by_issuer = snapshot.chain_by_issuer.get(issuer, ())
+        by_kid = ()
+        if kid and isinstance(kid, str):
+            snapshots = self._get_snapshots()[0]
+            by_kid = tuple(
+                validator_id
+                for validator_id in snapshot.chain
+                if snapshots[validator_id].public_key_jwk_uri
+                and jwks_store.has_key(snapshots[validator_id].public_key_jwk_uri, kid)
+            )
+        preferred = [
+            validator_id for validator_id in by_issuer if validator_id in by_kid
+        ]
+        preferred.extend(by_issuer)
+        preferred.extend(by_kid)
+        preferred.extend(snapshot.chain)
+        return tuple(dict.fromkeys(preferred))
+
+    @api.model
+    def _search_validator(self, domain, validator_name):
         validator = self.search(domain)
         if not validator:
             _logger.error("JWT validator not found for name %r", validator_name)
@@ -158,10 +466,12 @@ class AuthJwtValidator(models.Model):
             raise AmbiguousJwtValidator()
         return validator
 
-    @tools.ormcache("self.public_key_jwk_uri", "kid")
+    @api.model
+    def _get_validator_by_name(self, validator_name):
+        return self.browse(self._get_snapshot_by_name(validator_name).id)
+
     def _get_key(self, kid):
-        jwks_client = PyJWKClient(self.public_key_jwk_uri, cache_keys=False)
-        return jwks_client.get_signing_key(kid).key
+        return jwks_store.get_key(self._get_snapshot().public_key_jwk_uri, kid)
 
     def _encode(self, payload, secret, expire):
         """Encode and sign a JWT payload so it can be decoded and validated with
@@ -170,53 +480,175 @@ class AuthJwtValidator(models.Model):
         The aud and iss claims are set to this validator's values.
         The exp claim is set according to the expire parameter.
         """
+        snapshot = self._get_snapshot()
         payload = dict(
             payload,
             exp=timegm(datetime.datetime.utcnow().utctimetuple()) + expire,
-            aud=self.audience,
-            iss=self.issuer,
+            aud=",".join(snapshot.audience),
+            iss=snapshot.issuer,
         )
         return jwt.encode(payload, key=secret, algorithm="HS256")
 
     def _decode(self, token, secret=None):
         """Validate and decode a JWT token, return the payload."""
-        if secret:
-            key = secret
-            algorithm = "HS256"
-        elif self.signature_type == "secret":
-            key = self.secret_key
-            algorithm = self.secret_algorithm
-        else:
+        snapshot = self._get_snapshot()
+        with metrics.timer("auth_jwt_decode_duration_seconds", validator=snapshot.name):
+            token_cache = self._get_snapshot_cache(snapshot, "token")
+            if token_cache is not None:
+                cache_key = token_cache.make_key(token, cookie=bool(secret))
+                payload = token_cache.get(cache_key)
+                if payload is not None:
+                    self._check_revocation(payload)
+                    return payload
+            if secret:
+                key = secret
+                algorithm = "HS256"
+            elif snapshot.signature_type == "secret":
+                key = snapshot.secret_key
+                algorithm = snapshot.algorithm
+            else:
+                try:
+                    header = jwt.get_unverified_header(token)
+                except Exception as e:
+                    _logger.info("Invalid token: %s", e)
+                    raise UnauthorizedInvalidToken() from e
+                try:
+                    key = self._get_key(header.get("kid"))
+                except JwksKeyNotFound as e:
+                    _logger.info("Invalid token: %s", e)
+                    raise UnauthorizedInvalidToken() from e
+                algorithm = snapshot.algorithm
             try:
-                header = jwt.get_unverified_header(token)
+                payload = jwt.decode(
+                    token,
+                    key=key,
+                    algorithms=[algorithm],
+                    options=dict(
+                        require=["exp", "aud", "iss"],
+                        verify_exp=True,
+                        verify_aud=True,
+                        verify_iss=True,
+                    ),
+                    audience=list(snapshot.audience),
+                    issuer=snapshot.issuer,
+                )
             except Exception as e:
                 _logger.info("Invalid token: %s", e)
                 raise UnauthorizedInvalidToken() from e
-            key = self._get_key(header.get("kid"))
-            algorithm = self.public_key_algorithm
-        try:
-            payload = jwt.decode(
-                token,
-                key=key,
-                algorithms=[algorithm],
-                options=dict(
-                    require=["exp", "aud", "iss"],
-                    verify_exp=True,
-                    verify_aud=True,
-                    verify_iss=True,
-                ),
-                audience=self.audience.split(","),
-                issuer=self.issuer,
-            )
-        except Exception as e:
-            _logger.info("Invalid token: %s", e)
-            raise UnauthorizedInvalidToken() from e
-        return payload
+            self._check_revocation(payload)
+            if token_cache is not None:
+                token_cache.put(cache_key, payload)
+            return payload
 
     def _get_uid(self, payload):
         # override for additional strategies
-        if self.user_id_strategy == "static":
-            return self.static_user_id.id
+        snapshot = self._get_snapshot()
+        if snapshot.user_id_strategy == "static":
+            return snapshot.static_user_id
+        if snapshot.user_id_strategy == "email":
+            return self._resolve_user_id("login", payload.get("email"), payload)
+        if snapshot.user_id_strategy == "claim":
+            return self._resolve_user_id(
+                "jwt_subject", payload.get(snapshot.user_id_claim), payload
+            )
+
+    def _resolve_user_id(self, field_name, value, payload):
+        """Return the id of the active user whose field_name is value.
+
+        Users are cached per validator. If no user matches and just-in-time
+        provisioning is enabled, a user is created from the payload.
+        """
+        if not value:
+            _logger.info("JWT payload has no value to match the user %s", field_name)
+            raise UnauthorizedUserNotFound()
+        snapshot = self._get_snapshot()
+        user_cache = self._get_snapshot_cache(snapshot, "user")
+        cache_key = (field_name, value)
+        if user_cache is not None:
+            self._check_identity_cache_signaling()
+            uid = user_cache.get(cache_key)
+            if uid:
+                return uid
+        user = self.env["res.users"].sudo().search([(field_name, "=", value)], limit=2)
+        if len(user) > 1:
+            _logger.info("Several users found for %s %s", field_name, value)
+            raise UnauthorizedUserNotFound()
+        if not user and snapshot.user_jit_provisioning:
+            user = self._provision_user(payload)
+        if not user:
+            _logger.info("No user found for %s %s", field_name, value)
+            raise UnauthorizedUserNotFound()
+        if user_cache is not None:
+            user_cache.put(cache_key, user.id, time.time() + snapshot.user_cache_ttl)
+        return user.id
+
+    def _prepare_user_vals(self, payload):
+        """Return the values of the user provisioned for payload, or None if
+        the payload does not have enough information to create one."""
+        snapshot = self._get_snapshot()
+        email = payload.get("email")
+        vals = {
+            "name": payload.get("name") or email,
+            "login": email,
+            "email": email,
+            "groups_id": [(6, 0, [self.env.ref("base.group_portal").id])],
+        }
+        if snapshot.user_id_strategy == "claim":
+            vals["jwt_subject"] = payload.get(snapshot.user_id_claim)
+        if not vals["login"] or not vals["name"]:
+            return None
+        return vals
+
+    def _provision_user(self, payload):
+        vals = self._prepare_user_vals(payload)
+        if not vals:
+            _logger.info("Not enough information in JWT payload to create a user")
+            return self.env["res.users"]
+        try:
+            with self.env.cr.savepoint():
+                return (
+                    self.env["res.users"]
+                    .sudo()
+                    .with_context(no_reset_password=True)
+                    .create(vals)
+                )
+        except Exception as e:
+            _logger.warning("Could not create user %s: %s", vals["login"], e)
+            return self.env["res.users"]
+
+    @api.model
+    def _invalidate_user_cache(self, users):
+        """Drop users from the user caches of all validators.
+
+        The caches of the current worker are updated at once, the other workers
+        reset theirs once the transaction is committed.
+        """
+        self._signal_identity_cache_change()
+        for snapshot in self._get_snapshots()[0].values():
+            user_cache = self._get_snapshot_cache(snapshot, "user")
+            if user_cache is None:
+                continue
+            for user in users:
+                user_cache.discard(("login", user.login))
+                if user.jwt_subject:
+                    user_cache.discard(("jwt_subject", user.jwt_subject))
+
+    def _check_revocation(self, payload):
+        jti = payload.get("jti")
+        if jti and self.env["auth.jwt.revoked.token"]._is_revoked(jti):
+            _logger.info("Revoked token: %s", jti)
+            raise UnauthorizedRevokedToken()
+
+    def _must_renew_cookie(self, payload):
+        """Tell if the cookie must be re-issued for a payload obtained from it."""
+        snapshot = self._get_snapshot()
+        if not snapshot.cookie_sliding_renewal:
+            return True
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)):
+            return True
+        remaining = exp - time.time()
+        return remaining < snapshot.cookie_max_age * snapshot.cookie_renewal_fraction
 
     def _get_and_check_uid(self, payload):
         uid = self._get_uid(payload)
@@ -227,16 +659,103 @@ class AuthJwtValidator(models.Model):
 
     def _get_partner_id(self, payload):
         # override for additional strategies
-        if self.partner_id_strategy == "email":
+        snapshot = self._get_snapshot()
+        if snapshot.partner_id_strategy == "email":
             email = payload.get("email")
             if not email:
                 _logger.debug("JWT payload does not have an email claim")
                 return
-            partner = self.env["res.partner"].search([("email", "=", email)])
-            if len(partner) != 1:
-                _logger.debug("%d partners found for email %s", len(partner), email)
+            return self._resolve_partner_id("email", email)
+        if snapshot.partner_id_strategy == "claim":
+            value = payload.get(snapshot.partner_id_claim)
+            if not value:
+                _logger.debug(
+                    "JWT payload does not have a %s claim", snapshot.partner_id_claim
+                )
                 return
-            return partner.id
+            return self._resolve_partner_id("jwt_external_id", value)
+
+    def _resolve_partner_id(self, field_name, value):
+        """Return the id of the only partner whose field_name is value, if any.
+
+        Results, including the absence of a match, are cached per validator.
+        """
+        snapshot = self._get_snapshot()
+        partner_cache = self._get_snapshot_cache(snapshot, "partner")
+        cache_key = (field_name, value)
+        if partner_cache is not None:
+            self._check_identity_cache_signaling()
+            partner_id = partner_cache.get(cache_key, default=MISSING)
+            if partner_id is not MISSING:
+                return partner_id
+        partner = self.env["res.partner"].search([(field_name, "=", value)], limit=2)
+        if len(partner) == 1:
+            partner_id = partner.id
+            ttl = snapshot.partner_cache_ttl
+        else:
+            _logger.debug("No unique partner found for %s %s", field_name, value)
+            partner_id = None
+            ttl = snapshot.partner_cache_negative_ttl
+        if partner_cache is not None:
+            partner_cache.put(cache_key, partner_id, time.time() + ttl)
+        return partner_id
+
+    @api.model
+    def _check_identity_cache_signaling(self):
+        """Reset the user and partner caches of the worker if users or partners
+        were modified in any worker since the last check."""
+        cr = self.env.cr
+        cr.execute(  # pylint: disable=sql-injection
+            f"SELECT last_value FROM {IDENTITY_CACHE_SIGNALING}"
+        )
+        version = cr.fetchone()[0]
+        if _identity_cache_versions.get(cr.dbname) != version:
+            for snapshot in self._get_snapshots()[0].values():
+                for cache_name in ("partner", "user"):
+                    cache = self._get_snapshot_cache(snapshot, cache_name)
+                    if cache is not None:
+                        cache.clear()
+            _identity_cache_versions[cr.dbname] = version
+
+    @api.model
+    def _signal_identity_cache_change(self):
+        """Make the other workers reset their user and partner caches once the
+        current transaction is committed."""
+        postcommit = self.env.cr.postcommit
+        if postcommit.data.get(IDENTITY_CACHE_SIGNALING):
+            return
+        postcommit.data[IDENTITY_CACHE_SIGNALING] = True
+        registry = self.env.registry
+
+        @postcommit.add
+        def signal():
+            with registry.cursor() as cr:
+                cr.execute(  # pylint: disable=sql-injection
+                    f"SELECT nextval('{IDENTITY_CACHE_SIGNALING}')"
+                )
+
+    @api.model
+    def _invalidate_partner_cache(self, partners):
+        """Drop partners from the partner caches of all validators.
+
+        The caches of the current worker are updated at once, the other workers
+        reset theirs once the transaction is committed.
+        """
+        cache_keys = []
+        for partner in partners:
+            if partner.email:
+                cache_keys.append(("email", partner.email))
+            if partner.jwt_external_id:
+                cache_keys.append(("jwt_external_id", partner.jwt_external_id))
+        if not cache_keys:
+            return
+        self._signal_identity_cache_change()
+        for snapshot in self._get_snapshots()[0].values():
+            partner_cache = self._get_snapshot_cache(snapshot, "partner")
+            if partner_cache is None:
+                continue
+            for cache_key in cache_keys:
+                partner_cache.discard(cache_key)
 
     def _get_and_check_partner_id(self, payload):
         partner_id = self._get_partner_id(payload)
@@ -246,6 +765,7 @@ class AuthJwtValidator(models.Model):
 
     def _register_hook(self):
         res = super()._register_hook()
+        self.clear_caches()
         self.search([])._register_auth_method()
         return res
 
@@ -277,6 +797,7 @@ class AuthJwtValidator(models.Model):
     @api.model_create_multi
     def create(self, vals):
         rec = super().create(vals)
+        self.clear_caches()
         rec._register_auth_method()
         return rec
 
@@ -284,15 +805,20 @@ class AuthJwtValidator(models.Model):
         if "name" in vals:
             self._unregister_auth_method()
         res = super().write(vals)
+        self.clear_caches()
+        clear_stores(self.env.cr.dbname, self.ids)
         self._register_auth_method()
         return res
 
     def unlink(self):
         self._unregister_auth_method()
-        return super().unlink()
+        clear_stores(self.env.cr.dbname, self.ids)
+        res = super().unlink()
+        self.clear_caches()
+        return res
 
     def _get_jwt_cookie_secret(self):
-        secret = self.env["ir.config_parameter"].sudo().get_param("database.secret")
+        secret = self._get_snapshot().cookie_secret
         if not secret:
             _logger.error("database.secret system parameter is not set.")
             raise ConfigurationError()
@@ -2,6 +2,7 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import logging
+import time
 
 from odoo import SUPERUSER_ID, api, models
 from odoo.http import request
@@ -14,6 +15,8 @@ from ..exceptions import (
     UnauthorizedMissingCookie,
     UnauthorizedSessionMismatch,
 )
+from ..metrics import metrics
+from .auth_jwt_validator import AUTHORIZATION_RE
 
 _logger = logging.getLogger(__name__)
 
@@ -61,53 +64,112 @@ class IrHttpJwt(models.AbstractModel):
             assert token
             return validator._decode(token)
         except UnauthorizedMissingAuthorizationHeader:
-            if not validator.cookie_enabled:
+            snapshot = validator._get_snapshot()
+            if not snapshot.cookie_enabled:
                 raise
-            token = cls._get_cookie_token(validator.cookie_name)
+            token = cls._get_cookie_token(snapshot.cookie_name)
             assert token
             return validator._decode(token, secret=validator._get_jwt_cookie_secret())
 
+    @classmethod
+    def _get_jwt_validator_chain(cls, snapshot):
+        """Return the ids of the validators to try, most likely first.
+
+        When the request has a bearer token, the chain is dispatched on its
+        issuer and key id. Otherwise validators are tried in chain order.
+        """
+        if len(snapshot.chain) == 1:
+            return snapshot.chain
+        authorization = request.httprequest.environ.get("HTTP_AUTHORIZATION")
+        mo = AUTHORIZATION_RE.match(authorization or "")
+        if not mo:
+            return snapshot.chain
+        return request.env["auth.jwt.validator"]._dispatch_chain(snapshot, mo.group(1))
+
     @classmethod
     def _auth_method_jwt(cls, validator_name=None):
         assert not request.uid
         assert not request.session.uid
         # # Use request cursor to allow partner creation strategy in validator
         env = api.Environment(request.cr, SUPERUSER_ID, {})
-        validator = env["auth.jwt.validator"]._get_validator_by_name(validator_name)
-        assert len(validator) == 1
+        Validator = env["auth.jwt.validator"]
+        snapshot = Validator._get_snapshot_by_name(validator_name)
+        name = snapshot.name
+        start = time.perf_counter()
+        try:
+            cls._auth_jwt_chain(Validator, snapshot)
+        except Exception as e:
+            metrics.inc(
+                "auth_jwt_requests_total", validator=name, result=type(e).__name__
+            )
+            raise
+        else:
+            metrics.inc("auth_jwt_requests_total", validator=name, result="success")
+        finally:
+            metrics.observe(
+                "auth_jwt_request_duration_seconds",
+                time.perf_counter() - start,
+                validator=name,
+            )
+
+    @classmethod
+    def _auth_jwt_chain(cls, Validator, snapshot):
+        """Authenticate the request with the first validator of the chain of
+        snapshot that accepts its token."""
+        name = snapshot.name
+        chain = snapshot.chain
 
         payload = None
         exceptions = {}
-        while validator:
+        validators = Validator.browse(cls._get_jwt_validator_chain(snapshot))
+        for depth, validator in enumerate(validators, 1):
+            snapshot = validator._get_snapshot()
             try:
                 payload = cls._get_jwt_payload(validator)
                 break
             except Unauthorized as e:
-                exceptions[validator.name] = e
-                validator = validator.next_validator_id
+                metrics.inc(
+                    "auth_jwt_failures_total",
+                    validator=snapshot.name,
+                    reason=type(e).__name__,
+                )
+                exceptions[snapshot.id] = e
 
         if not payload:
             if len(exceptions) == 1:
                 raise list(exceptions.values())[0]
-            raise UnauthorizedCompositeJwtError(exceptions)
+            # report errors in chain order, whatever the order validators were tried
+            snapshots = Validator._get_snapshots()[0]
+            raise UnauthorizedCompositeJwtError(
+                {
+                    snapshots[validator_id].name: exceptions[validator_id]
+                    for validator_id in chain
+                    if validator_id in exceptions
+                }
+            )
 
-        if validator.cookie_enabled:
-            if not validator.cookie_name:
-                _logger.info("Cookie name not set for validator %s", validator.name)
+        # the cookie is only used when the Authorization header is missing
+        from_cookie = not request.httprequest.environ.get("HTTP_AUTHORIZATION")
+        if snapshot.cookie_enabled and (
+            not from_cookie or validator._must_renew_cookie(payload)
+        ):
+            if not snapshot.cookie_name:
+                _logger.info("Cookie name not set for validator %s", snapshot.name)
                 raise ConfigurationError()
             request.future_response.set_cookie(
-                key=validator.cookie_name,
+                key=snapshot.cookie_name,
                 value=validator._encode(
                     payload,
                     secret=validator._get_jwt_cookie_secret(),
-                    expire=validator.cookie_max_age,
+                    expire=snapshot.cookie_max_age,
                 ),
-                max_age=validator.cookie_max_age,
-                path=validator.cookie_path or "/",
-                secure=validator.cookie_secure,
+                max_age=snapshot.cookie_max_age,
+                path=snapshot.cookie_path or "/",
+                secure=snapshot.cookie_secure,
                 httponly=True,
             )
 
+        metrics.inc("auth_jwt_chain_depth_total", validator=name, depth=depth)
         uid = validator._get_and_check_uid(payload)
         assert uid
         partner_id = validator._get_and_check_partner_id(payload)
@@ -119,10 +181,9 @@ class IrHttpJwt(models.AbstractModel):
     def _auth_method_public_or_jwt(cls, validator_name=None):
         if "HTTP_AUTHORIZATION" not in request.httprequest.environ:
             env = api.Environment(request.cr, SUPERUSER_ID, {})
-            validator = env["auth.jwt.validator"]._get_validator_by_name(validator_name)
-            assert len(validator) == 1
-            if not validator.cookie_enabled or not request.httprequest.cookies.get(
-                validator.cookie_name
+            snapshot = env["auth.jwt.validator"]._get_snapshot_by_name(validator_name)
+            if not snapshot.cookie_enabled or not request.httprequest.cookies.get(
+                snapshot.cookie_name
             ):
                 return cls._auth_method_public()
         return cls._auth_method_jwt(validator_name)
@@ -0,0 +1,45 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import api, fields, models
+
+PARTNER_CACHE_FIELDS = {"email", "jwt_external_id", "active"}
+
+
+class ResPartner(models.Model):
+    _inherit = "res.partner"
+
+    jwt_external_id = fields.Char(
+        string="JWT External ID",
+        copy=False,
+        help="Identifier of the partner in JWT tokens, used by JWT validators "
+        "resolving partners from a claim.",
+    )
+
+    _sql_constraints = [
+        (
+            "jwt_external_id_uniq",
+            "unique(jwt_external_id)",
+            "The JWT External ID must be unique.",
+        ),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partners = super().create(vals_list)
+        # forget claim values that did not match any partner so far
+        self.env["auth.jwt.validator"].sudo()._invalidate_partner_cache(partners)
+        return partners
+
+    def write(self, vals):
+        if PARTNER_CACHE_FIELDS.isdisjoint(vals):
+            return super().write(vals)
+        Validator = self.env["auth.jwt.validator"].sudo()
+        Validator._invalidate_partner_cache(self)
+        res = super().write(vals)
+        Validator._invalidate_partner_cache(self)
+        return res
+
+    def unlink(self):
+        self.env["auth.jwt.validator"].sudo()._invalidate_partner_cache(self)
+        return super().unlink()
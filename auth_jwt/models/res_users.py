@@ -0,0 +1,34 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import fields, models
+
+USER_CACHE_FIELDS = {"login", "jwt_subject", "active"}
+
+
+class ResUsers(models.Model):
+    _inherit = "res.users"
+
+    jwt_subject = fields.Char(
+        string="JWT Subject",
+        copy=False,
+        help="Identifier of the user in JWT tokens, used by JWT validators "
+        "resolving users from a claim.",
+    )
+
+    _sql_constraints = [
+        ("jwt_subject_uniq", "unique(jwt_subject)", "The JWT Subject must be unique."),
+    ]
+
+    def write(self, vals):
+        if USER_CACHE_FIELDS.isdisjoint(vals):
+            return super().write(vals)
+        Validator = self.env["auth.jwt.validator"].sudo()
+        Validator._invalidate_user_cache(self)
+        res = super().write(vals)
+        Validator._invalidate_user_cache(self)
+        return res
+
+    def unlink(self):
+        self.env["auth.jwt.validator"].sudo()._invalidate_user_cache(self)
+        return super().unlink()
@@ -1 +1,3 @@
 from . import test_auth_jwt
+from . import test_jwks
+from . import test_metrics
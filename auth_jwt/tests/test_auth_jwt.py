@@ -3,7 +3,7 @@
 
 import contextlib
 import time
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import jwt
 
@@ -13,6 +13,8 @@ from odoo.tests.common import TransactionCase
 from odoo.tools import mute_logger
 from odoo.tools.misc import DotDict
 
+from ..bloom import BloomFilter
+from ..cache import clear_stores
 from ..exceptions import (
     AmbiguousJwtValidator,
     JwtValidatorNotFound,
@@ -21,10 +23,17 @@ from ..exceptions import (
     UnauthorizedMalformedAuthorizationHeader,
     UnauthorizedMissingAuthorizationHeader,
     UnauthorizedPartnerNotFound,
+    UnauthorizedRevokedToken,
+    UnauthorizedUserNotFound,
 )
+from ..metrics import metrics
 
 
 class TestAuthMethod(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(clear_stores, self.env.cr.dbname)
+
     @contextlib.contextmanager
     def _mock_request(self, authorization):
         environ = {}
@@ -57,10 +66,16 @@ class TestAuthMethod(TransactionCase):
         exp_delta=100,
         nbf=None,
         email=None,
+        jti=None,
+        sub=None,
     ):
         payload = dict(aud=audience, iss=issuer, exp=time.time() + exp_delta)
         if email:
             payload["email"] = email
+        if sub:
+            payload["sub"] = sub
+        if jti:
+            payload["jti"] = jti
         if nbf:
             payload["nbf"] = nbf
         return jwt.encode(payload, key=key, algorithm="HS256")
@@ -115,6 +130,51 @@ class TestAuthMethod(TransactionCase):
         with self._mock_request(authorization=authorization):
             self.env["ir.http"]._auth_method_jwt_validator()
 
+    def test_auth_method_metrics(self):
+        validator2 = self._create_validator("validator2", audience="bad")
+        validator2.next_validator_id = self._create_validator("validator3")
+        authorization = "Bearer " + self._create_token()
+        metrics.reset()
+        with self._mock_request(authorization=authorization):
+            self.env["ir.http"]._auth_method_jwt_validator2()
+        with self._mock_request(authorization=None):
+            with self.assertRaises(UnauthorizedMissingAuthorizationHeader):
+                self.env["ir.http"]._auth_method_jwt_validator2()
+        self.assertEqual(
+            metrics.get(
+                "auth_jwt_requests_total", validator="validator2", result="success"
+            ),
+            1,
+        )
+        self.assertEqual(
+            metrics.get(
+                "auth_jwt_requests_total",
+                validator="validator2",
+                result="UnauthorizedMissingAuthorizationHeader",
+            ),
+            1,
+        )
+        self.assertEqual(
+            metrics.get(
+                "auth_jwt_failures_total",
+                validator="validator2",
+                reason="UnauthorizedInvalidToken",
+            ),
+            1,
+        )
+        self.assertEqual(
+            metrics.get("auth_jwt_chain_depth_total", validator="validator2", depth=2),
+            1,
+        )
+        self.assertEqual(
+            metrics.get("auth_jwt_decode_duration_seconds", validator="validator3"),
+            1,
+        )
+        self.assertEqual(
+            metrics.get("auth_jwt_request_duration_seconds", validator="validator2"),
+            2,
+        )
+
     def test_auth_method_valid_token_two_validators_one_bad_issuer(self):
         self._create_validator("validator2", issuer="http://other.issuer")
         self._create_validator("validator3")
@@ -399,3 +459,403 @@ class TestAuthMethod(TransactionCase):
         with self._mock_request(authorization=authorization) as request:
             self.env["ir.http"]._auth_method_public_or_jwt_validator()
             assert request.jwt_payload["aud"] == "me"
+
+    def test_snapshot_refreshed_on_write(self):
+        validator = self._create_validator("validator", audience="a1,a2")
+        snapshot = validator._get_snapshot()
+        self.assertEqual(snapshot.audience, ("a1", "a2"))
+        self.assertEqual(snapshot.chain, (validator.id,))
+        validator2 = self._create_validator("validator2")
+        validator.next_validator_id = validator2
+        validator.audience = "a3"
+        snapshot = validator._get_snapshot()
+        self.assertEqual(snapshot.audience, ("a3",))
+        self.assertEqual(snapshot.chain, (validator.id, validator2.id))
+        validator2.unlink()
+        self.assertEqual(validator._get_snapshot().chain, (validator.id,))
+
+    def test_get_validator_by_name_no_query(self):
+        AuthJwtValidator = self.env["auth.jwt.validator"]
+        validator = self._create_validator("validator")
+        # warm up the registry cache
+        AuthJwtValidator._get_validator_by_name("validator")
+        with self.assertQueryCount(0):
+            self.assertEqual(
+                AuthJwtValidator._get_validator_by_name("validator"), validator
+            )
+
+    def test_get_validator_by_name_domain(self):
+        AuthJwtValidator = self.env["auth.jwt.validator"]
+        self._create_validator("validator")
+        validator2 = self._create_validator("validator2")
+        with patch.object(
+            type(AuthJwtValidator),
+            "_get_validator_by_name_domain",
+            return_value=[("name", "=", "validator2")],
+        ):
+            self.assertEqual(
+                AuthJwtValidator._get_validator_by_name("validator"), validator2
+            )
+            self.assertEqual(
+                AuthJwtValidator._get_snapshot_by_name("validator").id,
+                validator2.id,
+            )
+
+    def test_token_cache(self):
+        validator = self._create_validator("validator")
+        self.assertIsNone(validator._get_cache("token"))
+        validator.token_cache_enabled = True
+        token_cache = validator._get_cache("token")
+        token = self._create_token()
+        payload = validator._decode(token)
+        with patch("jwt.decode") as decode:
+            self.assertEqual(validator._decode(token), payload)
+        decode.assert_not_called()
+        self.assertEqual((token_cache.hits, token_cache.misses), (1, 1))
+        # a token verified as bearer is not trusted as cookie
+        with self.assertRaises(UnauthorizedInvalidToken):
+            validator._decode(token, secret="thecookiesecret")
+
+    def test_token_cache_survives_registry_cache_clear(self):
+        validator = self._create_validator("validator")
+        validator.token_cache_enabled = True
+        token_cache = validator._get_cache("token")
+        validator._decode(self._create_token())
+        self.env["auth.jwt.validator"].clear_caches()
+        self.assertIs(validator._get_cache("token"), token_cache)
+        self.assertEqual(len(token_cache), 1)
+        # the cache is reset when the validator is modified
+        validator.audience = "other"
+        self.assertEqual(len(validator._get_cache("token")), 0)
+
+    def test_token_cache_expiry(self):
+        validator = self._create_validator("validator")
+        validator.write({"token_cache_enabled": True, "token_cache_max_age": 0})
+        token = self._create_token()
+        validator._decode(token)
+        validator._decode(token)
+        token_cache = validator._get_cache("token")
+        self.assertEqual((token_cache.hits, token_cache.misses), (0, 2))
+
+    def test_token_cache_size(self):
+        validator = self._create_validator("validator")
+        validator.write({"token_cache_enabled": True, "token_cache_size": 2})
+        for exp_delta in (100, 101, 102):
+            validator._decode(self._create_token(exp_delta=exp_delta))
+        self.assertEqual(len(validator._get_cache("token")), 2)
+
+    def test_chain_dispatch_by_issuer(self):
+        validator1 = self._create_validator("validator", issuer="http://other.issuer")
+        validator2 = self._create_validator("validator2", issuer="http://more.issuer")
+        validator3 = self._create_validator("validator3")
+        validator1.next_validator_id = validator2
+        validator2.next_validator_id = validator3
+        self.assertEqual(
+            self.env["auth.jwt.validator"]._dispatch_chain(
+                validator1._get_snapshot(), self._create_token()
+            ),
+            (validator3.id, validator1.id, validator2.id),
+        )
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization) as request, patch(
+            "jwt.decode", wraps=jwt.decode
+        ) as decode:
+            self.env["ir.http"]._auth_method_jwt_validator()
+        # the token went straight to validator3
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(request.jwt_payload["iss"], "http://the.issuer")
+
+    def test_chain_dispatch_invalid_token(self):
+        validator = self._create_validator("validator")
+        validator2 = self._create_validator("validator2", issuer="http://o.issuer")
+        validator.next_validator_id = validator2
+        self.assertEqual(
+            self.env["auth.jwt.validator"]._dispatch_chain(
+                validator._get_snapshot(), "notatoken"
+            ),
+            (validator.id, validator2.id),
+        )
+
+    def test_chain_dispatch_malformed_issuer(self):
+        validator = self._create_validator("validator")
+        validator2 = self._create_validator("validator2", issuer="http://o.issuer")
+        validator.next_validator_id = validator2
+        token = jwt.encode(
+            {"aud": "me", "iss": ["http://o.issuer"], "exp": time.time() + 100},
+            key="thesecret",
+            algorithm="HS256",
+        )
+        self.assertEqual(
+            self.env["auth.jwt.validator"]._dispatch_chain(
+                validator._get_snapshot(), token
+            ),
+            (validator.id, validator2.id),
+        )
+        with self._mock_request(authorization="Bearer " + token):
+            with self.assertRaises(UnauthorizedCompositeJwtError):
+                self.env["ir.http"]._auth_method_jwt_validator()
+
+    def test_partner_cache(self):
+        partner = self.env["res.partner"].create(
+            {"name": "JWT Partner", "email": "jwt.partner@example.com"}
+        )
+        validator = self._create_validator("validator")
+        payload = {"email": "jwt.partner@example.com"}
+        self.assertEqual(validator._get_partner_id(payload), partner.id)
+        # only the signaling of the other workers is read
+        with self.assertQueryCount(1):
+            self.assertEqual(validator._get_partner_id(payload), partner.id)
+        partner.email = "jwt.other@example.com"
+        self.assertFalse(validator._get_partner_id(payload))
+        self.assertEqual(
+            validator._get_partner_id({"email": "jwt.other@example.com"}), partner.id
+        )
+
+    def _signal_from_other_worker(self):
+        """Signal a change of users or partners, as another worker does once
+        its transaction is committed."""
+        self.env.cr.execute("SELECT nextval('auth_jwt_identity_cache_signaling')")
+
+    def test_partner_changed_by_other_worker(self):
+        partner = self.env["res.partner"].create(
+            {"name": "JWT Partner", "email": "jwt.partner@example.com"}
+        )
+        validator = self._create_validator("validator")
+        payload = {"email": "jwt.partner@example.com"}
+        self.assertEqual(validator._get_partner_id(payload), partner.id)
+        # another worker changes the email, without touching our caches
+        self.env.cr.execute(
+            "UPDATE res_partner SET email = 'jwt.other@example.com' WHERE id = %s",
+            (partner.id,),
+        )
+        partner.invalidate_recordset(["email"])
+        self.assertEqual(validator._get_partner_id(payload), partner.id)
+        self._signal_from_other_worker()
+        self.assertFalse(validator._get_partner_id(payload))
+
+    def test_partner_write_signals_other_workers(self):
+        partner = self.env["res.partner"].create({"name": "JWT Partner"})
+        Validator = type(self.env["auth.jwt.validator"])
+        with patch.object(Validator, "_signal_identity_cache_change") as signal:
+            partner.phone = "+32 2 000 00 00"
+            signal.assert_not_called()
+            partner.email = "jwt.partner@example.com"
+            signal.assert_called()
+
+    def test_partner_write_keeps_registry_cache(self):
+        partner = self.env["res.partner"].create(
+            {"name": "JWT Partner", "email": "jwt.partner@example.com"}
+        )
+        validator = self._create_validator("validator")
+        validator.token_cache_enabled = True
+        validator._decode(self._create_token())
+        snapshots = self.env["auth.jwt.validator"]._get_snapshots()
+        partner.email = "jwt.other@example.com"
+        partner.unlink()
+        self.assertIs(self.env["auth.jwt.validator"]._get_snapshots(), snapshots)
+        self.assertEqual(len(validator._get_cache("token")), 1)
+
+    def test_partner_cache_negative(self):
+        validator = self._create_validator("validator")
+        payload = {"email": "jwt.new@example.com"}
+        self.assertFalse(validator._get_partner_id(payload))
+        with self.assertQueryCount(1):
+            self.assertFalse(validator._get_partner_id(payload))
+        partner = self.env["res.partner"].create(
+            {"name": "JWT Partner", "email": "jwt.new@example.com"}
+        )
+        self.assertEqual(validator._get_partner_id(payload), partner.id)
+
+    def test_partner_cache_disabled(self):
+        validator = self._create_validator("validator")
+        validator.partner_cache_size = 0
+        self.assertIsNone(validator._get_cache("partner"))
+
+    def test_partner_id_strategy_claim(self):
+        partner = self.env["res.partner"].create(
+            {"name": "JWT Partner", "jwt_external_id": "the-subject"}
+        )
+        validator = self._create_validator("validator")
+        validator.partner_id_strategy = "claim"
+        self.assertEqual(validator._get_partner_id({"sub": "the-subject"}), partner.id)
+        self.assertFalse(validator._get_partner_id({"sub": "other-subject"}))
+        self.assertFalse(validator._get_partner_id({}))
+        validator.partner_id_claim = "partner"
+        self.assertEqual(
+            validator._get_partner_id({"partner": "the-subject"}), partner.id
+        )
+
+    def _cookie_validator(self):
+        validator = self._create_validator("validator")
+        validator.write(
+            {
+                "cookie_enabled": True,
+                "cookie_name": "jwt_cookie",
+                "cookie_max_age": 1000,
+                "cookie_sliding_renewal": True,
+                "cookie_renewal_fraction": 0.5,
+            }
+        )
+        return validator
+
+    def _cookie_auth(self, validator, expire):
+        token = validator._encode(
+            {}, secret=validator._get_jwt_cookie_secret(), expire=expire
+        )
+        with self._mock_request(authorization=None) as request:
+            request.httprequest.cookies = {"jwt_cookie": token}
+            self.env["ir.http"]._auth_method_jwt_validator()
+        return request.future_response.set_cookie
+
+    def test_cookie_sliding_renewal(self):
+        validator = self._cookie_validator()
+        # recent cookie, not re-issued
+        self._cookie_auth(validator, expire=900).assert_not_called()
+        # cookie close to its expiration, re-issued
+        self._cookie_auth(validator, expire=100).assert_called_once()
+        # a bearer token always issues a cookie
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt_validator()
+        request.future_response.set_cookie.assert_called_once()
+
+    def test_cookie_renewed_without_sliding_renewal(self):
+        validator = self._cookie_validator()
+        validator.cookie_sliding_renewal = False
+        self._cookie_auth(validator, expire=900).assert_called_once()
+
+    def test_cookie_secret_cached(self):
+        validator = self._cookie_validator()
+        secret = validator._get_jwt_cookie_secret()
+        with self.assertQueryCount(0):
+            self.assertEqual(validator._get_jwt_cookie_secret(), secret)
+
+    def test_revoked_token(self):
+        RevokedToken = self.env["auth.jwt.revoked.token"]
+        validator = self._create_validator("validator")
+        validator.token_cache_enabled = True
+        token = self._create_token(jti="thejti")
+        payload = validator._decode(token)
+        # nothing revoked, the filter spares a query
+        RevokedToken._is_revoked("otherjti")
+        with self.assertQueryCount(0):
+            self.assertFalse(RevokedToken._is_revoked("otherjti"))
+        RevokedToken._revoke(payload)
+        with self.assertRaises(UnauthorizedRevokedToken):
+            validator._decode(token)
+        validator._decode(self._create_token(jti="otherjti"))
+        validator._decode(self._create_token())
+
+    def test_revoked_token_prune(self):
+        RevokedToken = self.env["auth.jwt.revoked.token"]
+        RevokedToken._revoke({"jti": "expiredjti", "exp": time.time() - 10})
+        RevokedToken._revoke({"jti": "thejti", "exp": time.time() + 100})
+        RevokedToken._cron_prune()
+        self.assertEqual(RevokedToken.search([]).mapped("jti"), ["thejti"])
+        self.assertFalse(RevokedToken._is_revoked("expiredjti"))
+        self.assertTrue(RevokedToken._is_revoked("thejti"))
+
+    def test_bloom_filter(self):
+        values = [f"jti{i}" for i in range(1000)]
+        bloom_filter = BloomFilter(values)
+        self.assertTrue(all(value in bloom_filter for value in values))
+        false_positives = sum(f"other{i}" in bloom_filter for i in range(1000))
+        self.assertLess(false_positives, 50)
+        self.assertNotIn("jti0", BloomFilter([]))
+
+    def _create_user(self, **vals):
+        return (
+            self.env["res.users"]
+            .with_context(no_reset_password=True)
+            .create(dict({"name": "JWT User", "login": "jwt.user@example.com"}, **vals))
+        )
+
+    def test_user_id_strategy_email(self):
+        user = self._create_user()
+        validator = self._create_validator("validator")
+        validator.user_id_strategy = "email"
+        payload = {"email": "jwt.user@example.com"}
+        self.assertEqual(validator._get_and_check_uid(payload), user.id)
+        with self.assertQueryCount(1):
+            self.assertEqual(validator._get_and_check_uid(payload), user.id)
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({"email": "jwt.nobody@example.com"})
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({})
+        user.login = "jwt.renamed@example.com"
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid(payload)
+
+    def test_user_id_strategy_claim(self):
+        user = self._create_user(jwt_subject="the-subject")
+        validator = self._create_validator("validator")
+        validator.user_id_strategy = "claim"
+        self.assertEqual(validator._get_and_check_uid({"sub": "the-subject"}), user.id)
+        user.active = False
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({"sub": "the-subject"})
+        validator.user_id_claim = "uid"
+        user.active = True
+        self.assertEqual(validator._get_and_check_uid({"uid": "the-subject"}), user.id)
+
+    def test_user_cache_ttl(self):
+        user = self._create_user(jwt_subject="the-subject")
+        validator = self._create_validator("validator")
+        validator.write({"user_id_strategy": "claim", "user_cache_ttl": 0})
+        self.assertEqual(validator._get_and_check_uid({"sub": "the-subject"}), user.id)
+        # the entry is already expired, the user is searched again
+        with self.assertQueryCount(2):
+            validator._get_and_check_uid({"sub": "the-subject"})
+
+    def test_user_deactivated_by_other_worker(self):
+        user = self._create_user(jwt_subject="the-subject")
+        validator = self._create_validator("validator")
+        validator.user_id_strategy = "claim"
+        authorization = "Bearer " + self._create_token(sub="the-subject")
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt_validator()
+        self.assertEqual(request.jwt_payload["sub"], "the-subject")
+        # another worker deactivates the user and signals it once committed
+        self.env.cr.execute(
+            "UPDATE res_users SET active = false WHERE id = %s", (user.id,)
+        )
+        user.invalidate_recordset(["active"])
+        self._signal_from_other_worker()
+        with self._mock_request(authorization=authorization), self.assertRaises(
+            UnauthorizedUserNotFound
+        ):
+            self.env["ir.http"]._auth_method_jwt_validator()
+
+    def test_user_write_signals_other_workers(self):
+        user = self._create_user()
+        Validator = type(self.env["auth.jwt.validator"])
+        with patch.object(Validator, "_signal_identity_cache_change") as signal:
+            user.active = False
+        signal.assert_called()
+
+    def test_user_write_keeps_registry_cache(self):
+        user = self._create_user(jwt_subject="the-subject")
+        validator = self._create_validator("validator")
+        validator.write({"user_id_strategy": "claim", "token_cache_enabled": True})
+        validator._decode(self._create_token())
+        snapshots = self.env["auth.jwt.validator"]._get_snapshots()
+        user.jwt_subject = "other-subject"
+        user.unlink()
+        self.assertIs(self.env["auth.jwt.validator"]._get_snapshots(), snapshots)
+        self.assertEqual(len(validator._get_cache("token")), 1)
+
+    def test_user_jit_provisioning(self):
+        validator = self._create_validator("validator")
+        validator.write({"user_id_strategy": "claim", "user_jit_provisioning": True})
+        payload = {"sub": "new-subject", "email": "jwt.new@example.com", "name": "New"}
+        uid = validator._get_and_check_uid(payload)
+        user = self.env["res.users"].browse(uid)
+        self.assertEqual(user.jwt_subject, "new-subject")
+        self.assertEqual(user.login, "jwt.new@example.com")
+        self.assertTrue(user.has_group("base.group_portal"))
+        self.assertEqual(validator._get_and_check_uid(payload), uid)
+        # the login is taken, the user cannot be created
+        with self.assertRaises(UnauthorizedUserNotFound), mute_logger(
+            "odoo.sql_db", "odoo.addons.auth_jwt.models.auth_jwt_validator"
+        ):
+            validator._get_and_check_uid(dict(payload, sub="other-subject"))
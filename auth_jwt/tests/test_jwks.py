@@ -0,0 +1,116 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import json
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from odoo.tests.common import TransactionCase
+
+from ..exceptions import UnauthorizedInvalidToken
+from ..jwks import JwksKeyNotFound, JwksStore, jwks_store
+
+
+class TestJwksStore(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.store = JwksStore(default_ttl=600, min_refresh_interval=60)
+        self.fetched = []
+        self.keys = {"k1": "key1"}
+
+        def _fetch(uri):
+            self.fetched.append(uri)
+            return dict(self.keys), 600
+
+        patcher = patch.object(self.store, "_fetch", side_effect=_fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_keys_fetched_once(self):
+        self.assertEqual(self.store.get_key("uri", "k1"), "key1")
+        self.assertEqual(self.store.get_key("uri", "k1"), "key1")
+        self.assertEqual(self.fetched, ["uri"])
+
+    def test_kid_miss_refreshes_once(self):
+        self.store.get_key("uri", "k1")
+        self.keys = {"k2": "key2"}
+        # the keys have just been fetched, an unknown kid does not refresh them
+        with self.assertRaises(JwksKeyNotFound):
+            self.store.get_key("uri", "k2")
+        self.assertEqual(len(self.fetched), 1)
+        # once min_refresh_interval has elapsed, an unknown kid refreshes them
+        self.store._entries["uri"].fetched_at -= 61
+        self.assertEqual(self.store.get_key("uri", "k2"), "key2")
+        self.assertEqual(len(self.fetched), 2)
+
+    def test_stale_key_served_during_refresh(self):
+        self.store.get_key("uri", "k1")
+        self.store._entries["uri"].expires_at = time.monotonic() - 1
+        with patch.object(self.store, "_refresh_in_background") as refresh:
+            self.assertEqual(self.store.get_key("uri", "k1"), "key1")
+        refresh.assert_called_once()
+
+    def test_single_key_without_kid(self):
+        self.assertEqual(self.store.get_key("uri", None), "key1")
+
+    def test_ttl(self):
+        self.assertEqual(self.store._get_ttl(None), 600)
+        self.assertEqual(self.store._get_ttl("public, max-age=120"), 120)
+        self.assertEqual(self.store._get_ttl("max-age=1"), 60)
+        self.assertEqual(self.store._get_ttl("max-age=999999"), 86400)
+        self.assertEqual(self.store._get_ttl("no-store"), 60)
+
+
+class TestJwksValidator(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(cls.private_key.public_key())
+        )
+        jwk.update(kid="thekid", use="sig", alg="RS256")
+        fd, cls.jwks_path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"keys": [jwk]}, f)
+        cls.addClassCleanup(os.unlink, cls.jwks_path)
+
+    def _create_validator(self, uri):
+        jwks_store.clear(uri)
+        return self.env["auth.jwt.validator"].create(
+            dict(
+                name="validator",
+                signature_type="public_key",
+                public_key_algorithm="RS256",
+                public_key_jwk_uri=uri,
+                audience="me",
+                issuer="http://the.issuer",
+                user_id_strategy="static",
+            )
+        )
+
+    def _create_token(self, kid="thekid"):
+        payload = dict(aud="me", iss="http://the.issuer", exp=time.time() + 100)
+        return jwt.encode(
+            payload, key=self.private_key, algorithm="RS256", headers={"kid": kid}
+        )
+
+    def test_file_uri(self):
+        validator = self._create_validator("file://" + self.jwks_path)
+        payload = validator._decode(self._create_token())
+        self.assertEqual(payload["aud"], "me")
+
+    def test_file_path(self):
+        validator = self._create_validator(self.jwks_path)
+        payload = validator._decode(self._create_token())
+        self.assertEqual(payload["aud"], "me")
+
+    def test_unknown_kid(self):
+        validator = self._create_validator(self.jwks_path)
+        with self.assertRaises(UnauthorizedInvalidToken):
+            validator._decode(self._create_token(kid="otherkid"))
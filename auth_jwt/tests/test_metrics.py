@@ -0,0 +1,74 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import os
+
+from odoo.tests import HttpCase, tagged
+from odoo.tests.common import BaseCase
+
+from ..metrics import Metrics
+
+
+class TestMetrics(BaseCase):
+    def test_render(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.inc("auth_jwt_requests_total", validator="v", result="success")
+        metrics.inc("auth_jwt_requests_total", validator="v", result="success")
+        metrics.observe("auth_jwt_decode_duration_seconds", 0.05, validator="v")
+        metrics.observe("auth_jwt_decode_duration_seconds", 0.5, validator="v")
+        metrics.observe("auth_jwt_decode_duration_seconds", 5, validator="v")
+        output = metrics.render(
+            [("auth_jwt_cache_hits_total", {"validator": 'a"b', "cache": "token"}, 3)]
+        )
+        lines = output.splitlines()
+        self.assertIn("# TYPE auth_jwt_requests_total counter", lines)
+        self.assertIn("# TYPE auth_jwt_decode_duration_seconds histogram", lines)
+        pid = ',pid="%d"' % os.getpid()
+        samples = dict(
+            line.replace(pid, "").rsplit(" ", 1)
+            for line in lines
+            if not line.startswith("#")
+        )
+        self.assertEqual(
+            samples['auth_jwt_requests_total{result="success",validator="v"}'], "2.0"
+        )
+        prefix = 'auth_jwt_decode_duration_seconds_bucket{validator="v"'
+        self.assertEqual(samples[prefix + ',le="0.1"}'], "1")
+        self.assertEqual(samples[prefix + ',le="1.0"}'], "2")
+        self.assertEqual(samples[prefix + ',le="+Inf"}'], "3")
+        self.assertEqual(
+            samples['auth_jwt_decode_duration_seconds_count{validator="v"}'], "3"
+        )
+        self.assertEqual(
+            samples['auth_jwt_cache_hits_total{cache="token",validator="a\\"b"}'],
+            "3.0",
+        )
+        self.assertEqual(
+            metrics.get("auth_jwt_requests_total", validator="v", result="success"), 2
+        )
+        self.assertEqual(
+            metrics.get("auth_jwt_decode_duration_seconds", validator="v"), 3
+        )
+
+
+@tagged("post_install", "-at_install")
+class TestMetricsEndpoint(HttpCase):
+    def test_disabled(self):
+        resp = self.url_open("/auth_jwt/metrics")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_token(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "auth_jwt.metrics_token", "thetoken"
+        )
+        resp = self.url_open("/auth_jwt/metrics")
+        self.assertEqual(resp.status_code, 401)
+        resp = self.url_open(
+            "/auth_jwt/metrics", headers={"Authorization": "Bearer wrong"}
+        )
+        self.assertEqual(resp.status_code, 401)
+        resp = self.url_open(
+            "/auth_jwt/metrics", headers={"Authorization": "Bearer thetoken"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers["Content-Type"].startswith("text/plain"))
@@ -0,0 +1,39 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import hashlib
+import time
+
+from .cache import TTLCache
+
+
+class TokenCache(TTLCache):
+    """Bounded LRU cache of the payloads of verified tokens.
+
+    Entries are keyed by the SHA-256 digest of the raw token and expire at the
+    token exp claim or after max_age seconds, whichever comes first.
+    """
+
+    def __init__(self, max_size, max_age):
+        super().__init__(max_size)
+        self.max_age = max_age
+
+    @staticmethod
+    def make_key(token, cookie=False):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest(), cookie
+
+    def get(self, key, default=None):
+        payload = super().get(key)
+        if payload is None:
+            return default
+        return dict(payload)
+
+    def put(self, key, payload, expires_at=None):
+        if expires_at is None:
+            expires_at = time.time() + self.max_age
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        super().put(key, dict(payload), expires_at)
@@ -0,0 +1,197 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+"""Benchmark of the auth_jwt request path.
+
+It is not part of the standard test suite. Run it with
+``--test-tags auth_jwt_benchmark``. The number of requests per scenario can be
+set with the ``AUTH_JWT_BENCHMARK_REQUESTS`` environment variable, and results
+are written as JSON to the file named by ``AUTH_JWT_BENCHMARK_OUTPUT``
+(``auth_jwt_benchmark.json`` in the temporary directory by default).
+"""
+
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+import odoo
+from odoo import release, tests
+
+from odoo.addons.auth_jwt.jwks import jwks_store
+
+_logger = logging.getLogger(__name__)
+
+
+class JwksHandler(BaseHTTPRequestHandler):
+    """Serve the JWKS of the benchmark, standing in for an identity provider."""
+
+    jwks = b'{"keys": []}'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Cache-Control", "public, max-age=3600")
+        self.end_headers()
+        self.wfile.write(self.jwks)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+@tests.tagged("post_install", "-at_install", "-standard", "auth_jwt_benchmark")
+class TestBenchmark(tests.HttpCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.requests = int(os.environ.get("AUTH_JWT_BENCHMARK_REQUESTS", 200))
+        cls.output = os.environ.get(
+            "AUTH_JWT_BENCHMARK_OUTPUT",
+            os.path.join(tempfile.gettempdir(), "auth_jwt_benchmark.json"),
+        )
+        cls.results = {}
+        cls.rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.ec_key = ec.generate_private_key(ec.SECP256R1())
+        keys = []
+        for kid, algorithm, key in (
+            ("rsa", jwt.algorithms.RSAAlgorithm, cls.rsa_key),
+            ("ec", jwt.algorithms.ECAlgorithm, cls.ec_key),
+        ):
+            jwk = json.loads(algorithm.to_jwk(key.public_key()))
+            jwk.update(kid=kid, use="sig")
+            keys.append(jwk)
+        JwksHandler.jwks = json.dumps({"keys": keys}).encode()
+        cls.jwks_server = ThreadingHTTPServer(("127.0.0.1", 0), JwksHandler)
+        threading.Thread(target=cls.jwks_server.serve_forever, daemon=True).start()
+        cls.jwks_uri = "http://127.0.0.1:%d/certs" % cls.jwks_server.server_port
+        cls.addClassCleanup(cls.jwks_server.shutdown)
+        cls.addClassCleanup(jwks_store.clear, cls.jwks_uri)
+
+    @classmethod
+    def tearDownClass(cls):
+        with open(cls.output, "w") as f:
+            json.dump(
+                {
+                    "odoo": release.version,
+                    "python": platform.python_version(),
+                    "requests": cls.requests,
+                    "timestamp": time.time(),
+                    "scenarios": cls.results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        _logger.info("auth_jwt benchmark results written to %s", cls.output)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.validator = self.env.ref("auth_jwt_demo.demo_validator")
+        self.partner = self.env["res.users"].search([("email", "!=", False)])[0]
+
+    def _token(self, key="thesecret", algorithm="HS256", kid=None):
+        payload = {
+            "aud": self.validator.audience,
+            "iss": self.validator.issuer,
+            "exp": time.time() + 3600,
+            "email": self.partner.email,
+        }
+        headers = {"kid": kid} if kid else None
+        return jwt.encode(payload, key=key, algorithm=algorithm, headers=headers)
+
+    def _run(self, scenario, url, headers):
+        # warm up caches and check the scenario actually authenticates
+        self.url_open(url, headers=headers).raise_for_status()
+        durations = []
+        queries = odoo.sql_db.sql_counter
+        start = time.perf_counter()
+        for _i in range(self.requests):
+            request_start = time.perf_counter()
+            resp = self.url_open(url, headers=headers)
+            durations.append(time.perf_counter() - request_start)
+            self.assertEqual(resp.status_code, 200)
+        elapsed = time.perf_counter() - start
+        queries = odoo.sql_db.sql_counter - queries
+        durations.sort()
+        self.results[scenario] = result = {
+            "requests_per_second": self.requests / elapsed,
+            "p50_ms": percentile(durations, 0.50) * 1000,
+            "p95_ms": percentile(durations, 0.95) * 1000,
+            "p99_ms": percentile(durations, 0.99) * 1000,
+            "queries_per_request": queries / self.requests,
+        }
+        _logger.info("auth_jwt benchmark %s: %s", scenario, result)
+
+    def _set_public_key(self, algorithm):
+        self.validator.write(
+            {
+                "signature_type": "public_key",
+                "public_key_algorithm": algorithm,
+                "public_key_jwk_uri": self.jwks_uri,
+            }
+        )
+
+    def test_hs256(self):
+        headers = {"Authorization": "Bearer " + self._token()}
+        self._run("hs256", "/auth_jwt_demo/whoami", headers)
+
+    def test_rs256(self):
+        self._set_public_key("RS256")
+        token = self._token(key=self.rsa_key, algorithm="RS256", kid="rsa")
+        headers = {"Authorization": "Bearer " + token}
+        self._run("rs256", "/auth_jwt_demo/whoami", headers)
+
+    def test_es256(self):
+        self._set_public_key("ES256")
+        token = self._token(key=self.ec_key, algorithm="ES256", kid="ec")
+        headers = {"Authorization": "Bearer " + token}
+        self._run("es256", "/auth_jwt_demo/whoami", headers)
+
+    def test_chained(self):
+        # the token is only accepted by the last of three chained validators
+        last_validator = self.validator.copy(
+            {"name": "benchmark_last", "next_validator_id": False}
+        )
+        middle_validator = self.validator.copy(
+            {
+                "name": "benchmark_middle",
+                "issuer": "benchmark_middle_issuer",
+                "next_validator_id": last_validator.id,
+            }
+        )
+        headers = {"Authorization": "Bearer " + self._token()}
+        self.validator.write(
+            {
+                "issuer": "benchmark_first_issuer",
+                "next_validator_id": middle_validator.id,
+            }
+        )
+        self._run("chained", "/auth_jwt_demo/whoami", headers)
+
+    def test_public_or_jwt(self):
+        headers = {"Authorization": "Bearer " + self._token()}
+        self._run("public_or_jwt", "/auth_jwt_demo/whoami-public-or-jwt", headers)
+
+    def test_cookie(self):
+        resp = self.url_open(
+            "/auth_jwt_demo_cookie/whoami",
+            headers={"Authorization": "Bearer " + self._token()},
+        )
+        resp.raise_for_status()
+        cookie = resp.cookies.get("demo_auth")
+        self._run(
+            "cookie", "/auth_jwt_demo_cookie/whoami", {"Cookie": f"demo_auth={cookie}"}
+        )
@@ -0,0 +1,49 @@
+# Copyright (C) 2022 XCG Consulting <https://xcg-consulting.fr/>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class AssertionCache:
+    """Thread-safe set of the ids of the assertions consumed by the worker.
+
+    Each id is kept until the assertion expires, and at most max_size ids are
+    kept, the least recently added ones being dropped first.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, assertion_id):
+        with self._lock:
+            expires_at = self._entries.get(assertion_id)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._entries[assertion_id]
+                return False
+            return True
+
+    def add(self, assertion_id, expires_at):
+        """Add assertion_id until expires_at, a POSIX timestamp."""
+        with self._lock:
+            self._entries[assertion_id] = expires_at
+            self._entries.move_to_end(assertion_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_assertion_cache(dbname):
+    cache = _caches.get(dbname)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(dbname, AssertionCache())
+    return cache
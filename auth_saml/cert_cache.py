@@ -0,0 +1,72 @@
+# Copyright (C) 2022 XCG Consulting <https://xcg-consulting.fr/>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class CertificateCache:
+    """Files holding the certificates and keys of the SAML providers, for
+    pysaml2 and xmlsec1 which need paths to them.
+
+    Each file is written once per process, under the checksum of its content,
+    in a private directory which is removed when the process exits.
+    """
+
+    def __init__(self):
+        self._directory = None
+        self._pid = None
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def _get_directory(self):
+        if self._pid != os.getpid():
+            # do not share the files of the process this one was forked from
+            self._directory = tempfile.mkdtemp(prefix="odoo-auth-saml-")
+            self._pid = os.getpid()
+            self._paths = {}
+        return self._directory
+
+    def get_path(self, checksum, get_data):
+        """Return the path of the file holding the content of checksum, which
+        is written with the result of get_data() if needed."""
+        with self._lock:
+            path = self._paths.get(checksum)
+            if path is None or self._pid != os.getpid():
+                path = os.path.join(self._get_directory(), checksum)
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(get_data())
+                self._paths[checksum] = path
+        return path
+
+    def discard(self, checksums):
+        """Remove the files of checksums."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for checksum in checksums:
+                path = self._paths.pop(checksum, None)
+                if path:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        _logger.warning("Could not remove %s", path, exc_info=True)
+
+    def cleanup(self):
+        """Remove the directory of the files of this process."""
+        with self._lock:
+            if self._directory and self._pid == os.getpid():
+                shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = self._pid = None
+            self._paths = {}
+
+
+cert_cache = CertificateCache()
+atexit.register(cert_cache.cleanup)
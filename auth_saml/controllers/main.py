@@ -2,12 +2,14 @@
 # Copyright (C) 2010-2016, 2022-2023 XCG Consulting <https://xcg-consulting.fr/>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import datetime
 import functools
 import json
 import logging
 
 import werkzeug.utils
 from werkzeug.exceptions import BadRequest
+from werkzeug.http import is_resource_modified
 from werkzeug.urls import url_quote_plus
 
 from odoo import (
@@ -25,6 +27,8 @@ from odoo.tools.misc import clean_context
 from odoo.addons.web.controllers.home import Home
 from odoo.addons.web.controllers.utils import _get_login_redirect_url, ensure_db
 
+from ..models.auth_saml_provider import METADATA_MAX_VALID
+
 _logger = logging.getLogger(__name__)
 
 
@@ -268,7 +272,7 @@ class AuthSAMLController(http.Controller):
     def saml_metadata(self, **kw):
         provider = kw.get("p")
         dbname = kw.get("d")
-        valid = kw.get("valid", None)
+        valid = self._parse_metadata_valid(kw.get("valid"))
 
         if not dbname or not provider:
             _logger.debug("Metadata page asked without database name or provider id")
@@ -276,17 +280,51 @@ class AuthSAMLController(http.Controller):
 
         provider = int(provider)
 
+        if request.db == dbname:
+            return self._saml_metadata_response(
+                api.Environment(request.cr, SUPERUSER_ID, {}), provider, valid
+            )
+
         registry = registry_get(dbname)
 
         with registry.cursor() as cr:
             env = api.Environment(cr, SUPERUSER_ID, {})
-            client = env["auth.saml.provider"].sudo().browse(provider)
-            if not client.exists():
-                return request.not_found(_("Unknown provider"))
-
-            return request.make_response(
-                client._metadata_string(
-                    valid, request.httprequest.url_root.rstrip("/")
-                ),
+            return self._saml_metadata_response(env, provider, valid)
+
+    def _parse_metadata_valid(self, valid):
+        """Return the validity of the metadata in hours, or None if not asked."""
+        if not valid:
+            return None
+        try:
+            valid = int(valid)
+        except ValueError:
+            raise BadRequest(_("Invalid validity")) from None
+        if not 1 <= valid <= METADATA_MAX_VALID:
+            raise BadRequest(_("Invalid validity"))
+        return valid
+
+    def _saml_metadata_response(self, env, provider_id, valid):
+        """Return the metadata of the provider, or a 304 response if the client
+        already has them."""
+        client = env["auth.saml.provider"].sudo().browse(provider_id)
+        if not client.exists():
+            return request.not_found(_("Unknown provider"))
+
+        base_url = request.httprequest.url_root.rstrip("/")
+        etag, last_modified = client._get_metadata_version(valid, base_url)
+        last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+        modified = is_resource_modified(
+            request.httprequest.environ, etag=etag, last_modified=last_modified
+        )
+        # werkzeug only handles conditional GET and HEAD requests
+        if modified or request.httprequest.method not in ("GET", "HEAD"):
+            response = request.make_response(
+                client._get_cached_metadata(valid, base_url),
                 [("Content-Type", "text/xml")],
             )
+        else:
+            response = request.make_response("", status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers["Cache-Control"] = "no-cache"
+        return response
@@ -0,0 +1,14 @@
+# Copyright (C) 2022 XCG Consulting <https://xcg-consulting.fr/>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+
+def migrate(cr, version):
+    # saml_request_id becomes unique: keep only the last outstanding request
+    # of each id, the others could not be answered anyway
+    cr.execute(
+        """
+        DELETE FROM auth_saml_request AS r
+        USING auth_saml_request AS other
+        WHERE r.saml_request_id = other.saml_request_id AND r.id < other.id
+        """
+    )
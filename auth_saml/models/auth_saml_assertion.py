@@ -0,0 +1,73 @@
+# Copyright (C) 2022 XCG Consulting <https://xcg-consulting.fr/>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import datetime
+
+from odoo import api, fields, models
+
+from ..assertion_cache import get_assertion_cache
+
+
+class AuthSamlAssertion(models.Model):
+    _name = "auth_saml.assertion"
+    _description = "SAML Consumed Assertions"
+    _rec_name = "assertion_id"
+
+    assertion_id = fields.Char("Assertion ID", required=True)
+    expires_at = fields.Datetime(
+        required=True,
+        index=True,
+        help="NotOnOrAfter of the assertion, after which it is not accepted anyway.",
+    )
+
+    _sql_constraints = [
+        (
+            "assertion_id_uniq",
+            "unique(assertion_id)",
+            "SAML assertion IDs must be unique.",
+        ),
+    ]
+
+    @api.model
+    def _consume(self, assertion_id: str, expires_at: datetime.datetime) -> bool:
+        """Record that an assertion is consumed, and return False if it already
+        was, by this worker or by another one.
+
+        The assertions seen by the worker are rejected from memory, the others
+        by inserting the id in the table, which fails if it is already there
+        and not expired.
+        """
+        cache = get_assertion_cache(self.env.cr.dbname)
+        if assertion_id in cache:
+            return False
+        self.env.cr.execute(
+            """
+            INSERT INTO auth_saml_assertion (
+                assertion_id, expires_at, create_uid, create_date, write_uid,
+                write_date
+            )
+            VALUES (
+                %(assertion_id)s, %(expires_at)s, %(uid)s,
+                now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            )
+            ON CONFLICT (assertion_id) DO UPDATE
+                SET expires_at = EXCLUDED.expires_at
+                WHERE auth_saml_assertion.expires_at <= now() at time zone 'UTC'
+            RETURNING id
+            """,
+            {
+                "assertion_id": assertion_id,
+                "expires_at": expires_at,
+                "uid": self.env.uid,
+            },
+        )
+        consumed = bool(self.env.cr.fetchone())
+        cache.add(
+            assertion_id, expires_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+        )
+        return consumed
+
+    @api.autovacuum
+    def _gc_expired_assertions(self):
+        """Delete the expired assertions, which are rejected by pysaml2 anyway"""
+        self.search([("expires_at", "<", fields.Datetime.now())]).unlink()
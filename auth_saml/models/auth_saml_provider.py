@@ -3,22 +3,33 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import base64
+import datetime
+import hashlib
 import json
 import logging
-import os
-import tempfile
 import urllib.parse
 
 # dependency name is pysaml2 # pylint: disable=W7936
 import saml2
 import saml2.xmldsig as ds
+from saml2 import samlp
 from saml2.client import Saml2Client
 from saml2.config import Config as Saml2Config
 
-from odoo import api, fields, models
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import ValidationError
+
+from ..cert_cache import cert_cache
 
 _logger = logging.getLogger(__name__)
 
+# how long assertions without NotOnOrAfter are remembered
+ASSERTION_DEFAULT_LIFETIME = datetime.timedelta(days=1)
+# maximum validity of the metadata, in hours
+METADATA_MAX_VALID = 24 * 365
+# metadata with a validity are generated again at least once per period
+METADATA_PERIOD = datetime.timedelta(hours=1)
+
 
 class AuthSamlProvider(models.Model):
     """Configuration values of a SAML2 provider"""
@@ -181,20 +192,15 @@ class AuthSamlProvider(models.Model):
         )
 
         if model_attachment._storage() != "file":
-            # For non-file locations we need to create a temp file to pass to pysaml.
-            fd, keys_path = tempfile.mkstemp()
-            with open(keys_path, "wb") as f:
-                f.write(base64.b64decode(keys.datas))
-            os.close(fd)
+            # For non-file locations we need a file to pass to pysaml, which is
+            # written once per worker.
+            keys_path = cert_cache.get_path(keys.checksum, lambda: keys.raw)
         else:
             keys_path = model_attachment._full_path(keys.store_fname)
 
         return keys_path
 
-    def _get_config_for_provider(self, base_url: str = None) -> Saml2Config:
-        """
-        Internal helper to get a configured Saml2Client
-        """
+    def _get_base_url_for_provider(self, base_url: str = None) -> str:
         self.ensure_one()
 
         if self.sp_baseurl:
@@ -204,7 +210,15 @@ class AuthSamlProvider(models.Model):
             base_url = (
                 self.env["ir.config_parameter"].sudo().get_param("web.base.url", "")
             )
+        return base_url
 
+    def _get_config_for_provider(self, base_url: str = None) -> Saml2Config:
+        """
+        Internal helper to get a configured Saml2Client
+        """
+        self.ensure_one()
+
+        base_url = self._get_base_url_for_provider(base_url)
         acs_url = urllib.parse.urljoin(base_url, "/auth_saml/signin")
         settings = {
             "metadata": {"inline": [self.idp_metadata]},
@@ -237,10 +251,35 @@ class AuthSamlProvider(models.Model):
         sp_config.allow_unknown_attributes = True
         return sp_config
 
+    def _get_cached_config_for_provider(self, base_url: str = None) -> Saml2Config:
+        """Return the configuration of the provider, which is parsed once per
+        worker and kept until the provider or its certificates change.
+
+        It is shared by all requests, and must not be modified.
+        """
+        self.ensure_one()
+        return self._get_cached_config(
+            self.id, self.write_date, self._get_base_url_for_provider(base_url)
+        )
+
+    @api.model
+    @tools.ormcache("provider_id", "write_date", "base_url")
+    def _get_cached_config(self, provider_id, write_date, base_url) -> Saml2Config:
+        provider = self.sudo().browse(provider_id)
+        return provider._get_config_for_provider(base_url)
+
     def _get_client_for_provider(self, base_url: str = None) -> Saml2Client:
-        sp_config = self._get_config_for_provider(base_url)
-        saml_client = Saml2Client(config=sp_config)
-        return saml_client
+        """Return a new client of the provider, from its cached configuration.
+
+        Clients keep the state of the requests they handle, so they are not
+        shared between requests.
+        """
+        self.ensure_one()
+        return Saml2Client(config=self._get_cached_config_for_provider(base_url))
+
+    def _clear_client_cache(self):
+        self._get_cached_config.clear_cache(self.env[self._name])
+        self._get_cached_metadata_string.clear_cache(self.env[self._name])
 
     def _get_auth_request(self, extra_state=None, url_root=None):
         """
@@ -285,8 +324,9 @@ class AuthSamlProvider(models.Model):
         response = client.parse_authn_request_response(
             token,
             saml2.entity.BINDING_HTTP_POST,
-            self._get_outstanding_requests_dict(),
+            self._get_outstanding_request(token),
         )
+        self._check_assertion_replay(response)
         matching_value = None
 
         if self.matching_attribute == "subject.nameId":
@@ -317,17 +357,58 @@ class AuthSamlProvider(models.Model):
         if post_vals:
             vals.update(post_vals)
 
+        # only a valid response consumes the request it answers
+        self._pop_outstanding_request(response.in_response_to)
+
         return vals
 
-    def _get_outstanding_requests_dict(self):
+    def _get_outstanding_request(self, token: str) -> dict:
+        """Return the outstanding request the response answers, as expected by
+        pysaml2."""
         self.ensure_one()
 
-        requests = (
-            self.env["auth_saml.request"]
+        in_response_to = None
+        try:
+            response = samlp.response_from_string(base64.b64decode(token))
+        except Exception:  # pylint: disable=broad-except
+            # the response is reported as invalid by pysaml2
+            _logger.debug("Could not parse SAML response", exc_info=True)
+        else:
+            in_response_to = response and response.in_response_to
+        if not in_response_to:
+            return {}
+        request_id = self.env["auth_saml.request"].sudo()._find(self.id, in_response_to)
+        return {in_response_to: request_id} if request_id else {}
+
+    def _pop_outstanding_request(self, in_response_to: str):
+        """Delete the outstanding request a validated response answers, so that
+        it can only be answered once."""
+        self.ensure_one()
+
+        if not in_response_to:
+            # unsolicited response, when they are allowed
+            return
+        if not self.env["auth_saml.request"].sudo()._pop(self.id, in_response_to):
+            raise ValidationError(
+                _("The SAML request %s was already answered.") % in_response_to
+            )
+
+    def _check_assertion_replay(self, response):
+        """Reject the assertions that were already consumed."""
+        self.ensure_one()
+
+        if response.not_on_or_after:
+            expires_at = datetime.datetime.utcfromtimestamp(response.not_on_or_after)
+        else:
+            expires_at = fields.Datetime.now() + ASSERTION_DEFAULT_LIFETIME
+        if not (
+            self.env["auth_saml.assertion"]
             .sudo()
-            .search([("saml_provider_id", "=", self.id)])
-        )
-        return {record.saml_request_id: record.id for record in requests}
+            ._consume(response.assertion.id, expires_at)
+        ):
+            raise ValidationError(
+                _("The SAML assertion %s was already used.") % response.assertion.id
+            )
 
     def _store_outstanding_request(self, reqid):
         self.ensure_one()
@@ -339,16 +420,102 @@ class AuthSamlProvider(models.Model):
     def _metadata_string(self, valid=None, base_url: str = None):
         self.ensure_one()
 
-        sp_config = self._get_config_for_provider(base_url)
+        sp_config = self._get_cached_config_for_provider(base_url)
         return saml2.metadata.create_metadata_string(
             None,
             config=sp_config,
             valid=valid,
-            cert=self._get_cert_key_path("sp_pem_public"),
-            keyfile=self._get_cert_key_path("sp_pem_private"),
+            cert=sp_config.cert_file,
+            keyfile=sp_config.key_file,
             sign=self.sign_metadata,
         )
 
+    @api.model
+    def _get_metadata_period(self, valid=None):
+        """Return the start of the current generation period of the metadata.
+
+        The validUntil date of metadata with a validity is computed when they are
+        generated, so they are generated again at each period, which is a tenth of
+        the validity and at most METADATA_PERIOD. Metadata without validity have
+        no period.
+        """
+        if not valid:
+            return None
+        period = min(METADATA_PERIOD, datetime.timedelta(hours=valid) / 10)
+        epoch = datetime.datetime(1970, 1, 1)
+        now = datetime.datetime.utcnow()
+        return now - (now - epoch) % period
+
+    def _get_metadata_version(self, valid=None, base_url: str = None):
+        """Return the ETag and the last modification date of the metadata.
+
+        They only depend on the provider, its certificates and the generation
+        period, so that they are the same in all workers.
+        """
+        self.ensure_one()
+        period = self._get_metadata_period(valid)
+
+        attachments = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search_read(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "in", ["sp_pem_public", "sp_pem_private"]),
+                    ("res_id", "=", self.id),
+                ],
+                ["checksum", "write_date"],
+            )
+        )
+        last_modified = max(
+            [self.write_date]
+            + [attachment["write_date"] for attachment in attachments]
+            + ([period] if period else [])
+        )
+        etag = hashlib.sha256(
+            json.dumps(
+                [
+                    self.id,
+                    str(self.write_date),
+                    self._get_base_url_for_provider(base_url),
+                    valid,
+                    period and str(period),
+                    sorted(attachment["checksum"] or "" for attachment in attachments),
+                ]
+            ).encode()
+        ).hexdigest()
+        return etag, last_modified.replace(microsecond=0)
+
+    def _get_cached_metadata(self, valid=None, base_url: str = None) -> str:
+        """Return the metadata of the provider, which is generated once per
+        worker and kept until the provider or its certificates change, or until
+        the end of the generation period."""
+        self.ensure_one()
+        return self._get_cached_metadata_string(
+            self.id,
+            self.write_date,
+            self._get_base_url_for_provider(base_url),
+            valid,
+            self._get_metadata_period(valid),
+        )
+
+    @api.model
+    @tools.ormcache("provider_id", "write_date", "base_url", "valid", "period")
+    def _get_cached_metadata_string(
+        self, provider_id, write_date, base_url, valid, period
+    ):
+        return self.sudo().browse(provider_id)._metadata_string(valid, base_url)
+
+    def write(self, vals):
+        result = super().write(vals)
+        self._clear_client_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self._clear_client_cache()
+        return result
+
     def _hook_validate_auth_response(self, response, matching_value):
         self.ensure_one()
         vals = {}
@@ -2,7 +2,11 @@
 # Copyright (C) 2022 XCG Consulting <https://xcg-consulting.fr/>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+OUTSTANDING_REQUEST_MAX_AGE = "auth_saml.outstanding_request_max_age"
 
 
 class AuthSamlRequest(models.TransientModel):
@@ -19,3 +23,70 @@ class AuthSamlRequest(models.TransientModel):
         "Current Request ID",
         required=True,
     )
+
+    _sql_constraints = [
+        (
+            "saml_request_id_uniq",
+            "unique(saml_request_id)",
+            "SAML request IDs must be unique.",
+        ),
+    ]
+
+    @api.model
+    def _get_max_age(self) -> timedelta:
+        """Age after which outstanding requests are not answered anymore"""
+        return timedelta(
+            seconds=int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param(OUTSTANDING_REQUEST_MAX_AGE, 3600)
+            )
+        )
+
+    @api.model
+    def _find(self, provider_id: int, saml_request_id: str) -> int:
+        """Return the id of an outstanding request that is not too old."""
+        self.flush_model()
+        self.env.cr.execute(
+            """
+            SELECT id FROM auth_saml_request
+            WHERE saml_provider_id = %s AND saml_request_id = %s
+                AND create_date >= %s
+            """,
+            (provider_id, saml_request_id, fields.Datetime.now() - self._get_max_age()),
+        )
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    @api.model
+    def _pop(self, provider_id: int, saml_request_id: str) -> int:
+        """Delete an outstanding request that is not too old, and return its id.
+
+        The row is deleted and returned by a single query, so that a request
+        can only be answered once, even by concurrent responses.
+        """
+        self.flush_model()
+        self.env.cr.execute(
+            """
+            DELETE FROM auth_saml_request
+            WHERE saml_provider_id = %s AND saml_request_id = %s
+                AND create_date >= %s
+            RETURNING id
+            """,
+            (provider_id, saml_request_id, fields.Datetime.now() - self._get_max_age()),
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        self.browse(row[0]).invalidate_recordset()
+        return row[0]
+
+    @api.autovacuum
+    def _gc_outstanding_requests(self):
+        """Delete the outstanding requests too old to be answered"""
+        self.flush_model()
+        self.env.cr.execute(
+            "DELETE FROM auth_saml_request WHERE create_date < %s",
+            (fields.Datetime.now() - self._get_max_age(),),
+        )
+        self.invalidate_model()
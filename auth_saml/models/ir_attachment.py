@@ -0,0 +1,70 @@
+# Copyright (C) 2022 XCG Consulting <https://xcg-consulting.fr/>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+from ..cert_cache import cert_cache
+
+# fields of an attachment that can change the certificate of a SAML provider
+SAML_CERTIFICATE_FIELDS = {
+    "datas",
+    "raw",
+    "db_datas",
+    "store_fname",
+    "checksum",
+    "res_model",
+    "res_field",
+    "res_id",
+}
+
+
+class IrAttachment(models.Model):
+    """Redefined to forget the SAML configurations and the certificate files
+    of modified certificates."""
+
+    _inherit = "ir.attachment"
+
+    def _get_saml_provider_checksums(self):
+        """Return the checksums of the attachments that are certificates of
+        SAML providers, in a single query that does not load the records."""
+        if not self.ids:
+            return []
+        self.flush_recordset(["res_model", "res_field", "checksum"])
+        self.env.cr.execute(
+            """
+            SELECT checksum FROM ir_attachment
+            WHERE id IN %s AND res_model = %s AND res_field IS NOT NULL
+            """,
+            (tuple(self.ids), "auth.saml.provider"),
+        )
+        return [checksum for checksum, in self.env.cr.fetchall()]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        result = super().create(vals_list)
+        if any(
+            vals.get("res_model") == "auth.saml.provider" and vals.get("res_field")
+            for vals in vals_list
+        ):
+            self.env["auth.saml.provider"]._clear_client_cache()
+        return result
+
+    def write(self, vals):
+        if SAML_CERTIFICATE_FIELDS.isdisjoint(vals):
+            return super().write(vals)
+        checksums = self._get_saml_provider_checksums()
+        result = super().write(vals)
+        if checksums or vals.get("res_model") == "auth.saml.provider":
+            self.env["auth.saml.provider"]._clear_client_cache()
+            cert_cache.discard(
+                set(checksums) - set(self._get_saml_provider_checksums())
+            )
+        return result
+
+    def unlink(self):
+        checksums = self._get_saml_provider_checksums()
+        result = super().unlink()
+        if checksums:
+            self.env["auth.saml.provider"]._clear_client_cache()
+            cert_cache.discard(set(checksums))
+        return result
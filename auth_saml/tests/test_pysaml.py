@@ -2,11 +2,18 @@
 import base64
 import html
 import os
+import stat
+from datetime import datetime, timedelta
 from unittest.mock import patch
 
+from saml2.response import UnsolicitedResponse
+
+from odoo import fields
 from odoo.exceptions import AccessDenied, UserError, ValidationError
 from odoo.tests import HttpCase, tagged
 
+from .. import assertion_cache
+from ..cert_cache import CertificateCache
 from .fake_idp import FakeIDP
 
 
@@ -358,3 +365,259 @@ class TestPySaml(HttpCase):
             self.authenticate(
                 user="user@example.com", password="NesTNSte9340D720te>/-A"
             )
+
+    def test_client_cache(self):
+        client = self.saml_provider._get_client_for_provider("http://localhost")
+        config = client.config
+        # clients are not shared, their configuration is
+        other_client = self.saml_provider._get_client_for_provider("http://localhost")
+        self.assertIsNot(other_client, client)
+        self.assertIs(other_client.config, config)
+        self.assertIsNot(
+            self.saml_provider._get_client_for_provider("http://other").config, config
+        )
+
+        # writing the provider parses a new configuration
+        self.saml_provider.write({"entity_id": "other"})
+        new_config = self.saml_provider._get_cached_config_for_provider(
+            "http://localhost"
+        )
+        self.assertIsNot(new_config, config)
+        self.assertEqual(new_config.entityid, "other")
+
+        # so does changing its certificates
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", "auth.saml.provider"),
+                    ("res_field", "=", "sp_pem_public"),
+                    ("res_id", "=", self.saml_provider.id),
+                ]
+            )
+        )
+        # but not changing its name
+        attachment.write({"name": "sp.pem"})
+        self.assertIs(
+            self.saml_provider._get_cached_config_for_provider("http://localhost"),
+            new_config,
+        )
+        attachment.write({"datas": attachment.datas})
+        self.assertIsNot(
+            self.saml_provider._get_cached_config_for_provider("http://localhost"),
+            new_config,
+        )
+
+    def test_cert_key_path_db_storage(self):
+        with patch.object(
+            type(self.env["ir.attachment"]), "_storage", return_value="db"
+        ):
+            path = self.saml_provider._get_cert_key_path("sp_pem_private")
+            self.assertEqual(
+                self.saml_provider._get_cert_key_path("sp_pem_private"), path
+            )
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            with open(path, "rb") as f:
+                self.assertEqual(
+                    base64.b64encode(f.read()), self.saml_provider.sp_pem_private
+                )
+
+            # the file of a replaced key is removed
+            self.saml_provider.sp_pem_private = self.saml_provider.sp_pem_public
+            self.assertFalse(os.path.exists(path))
+            new_path = self.saml_provider._get_cert_key_path("sp_pem_private")
+            self.assertNotEqual(new_path, path)
+            self.assertTrue(os.path.exists(new_path))
+
+    def test_cert_cache_cleanup(self):
+        cert_cache = CertificateCache()
+        path = cert_cache.get_path("checksum", lambda: b"data")
+        directory = os.path.dirname(path)
+        self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700)
+        cert_cache.cleanup()
+        self.assertFalse(os.path.exists(directory))
+
+    def test_outstanding_request_answered_once(self):
+        self.add_provider_to_user()
+        redirect_url = self.saml_provider._get_auth_request()
+        saml_response = self.idp.fake_login(redirect_url)._unpack().get("SAMLResponse")
+        self.assertEqual(
+            self.env["auth_saml.request"].search_count(
+                [("saml_provider_id", "=", self.saml_provider.id)]
+            ),
+            1,
+        )
+
+        self.env["res.users"].sudo().auth_saml(
+            self.saml_provider.id, saml_response, None
+        )
+        self.assertFalse(
+            self.env["auth_saml.request"].search(
+                [("saml_provider_id", "=", self.saml_provider.id)]
+            )
+        )
+        with self.assertRaises(UnsolicitedResponse):
+            self.env["res.users"].sudo().auth_saml(
+                self.saml_provider.id, saml_response, None
+            )
+
+    def test_outstanding_request_kept_on_failure(self):
+        self.add_provider_to_user()
+        redirect_url = self.saml_provider._get_auth_request()
+        saml_response = self.idp.fake_login(redirect_url)._unpack().get("SAMLResponse")
+        with patch.object(
+            type(self.saml_provider),
+            "_hook_validate_auth_response",
+            side_effect=ValidationError("invalid"),
+        ), self.assertRaises(ValidationError):
+            self.env["res.users"].sudo().auth_saml(
+                self.saml_provider.id, saml_response, None
+            )
+        # a response that fails validation does not consume the request
+        self.assertEqual(
+            self.env["auth_saml.request"].search_count(
+                [("saml_provider_id", "=", self.saml_provider.id)]
+            ),
+            1,
+        )
+
+    def test_outstanding_request_max_age(self):
+        self.add_provider_to_user()
+        redirect_url = self.saml_provider._get_auth_request()
+        saml_response = self.idp.fake_login(redirect_url)._unpack().get("SAMLResponse")
+        self.env["ir.config_parameter"].sudo().set_param(
+            "auth_saml.outstanding_request_max_age", 60
+        )
+        with patch.object(
+            fields.Datetime,
+            "now",
+            return_value=fields.Datetime.now() + timedelta(minutes=2),
+        ):
+            with self.assertRaises(UnsolicitedResponse):
+                self.env["res.users"].sudo().auth_saml(
+                    self.saml_provider.id, saml_response, None
+                )
+            self.env["auth_saml.request"]._gc_outstanding_requests()
+        self.assertFalse(
+            self.env["auth_saml.request"].search(
+                [("saml_provider_id", "=", self.saml_provider.id)]
+            )
+        )
+
+    def test_assertion_replay(self):
+        self.add_provider_to_user()
+        redirect_url = self.saml_provider._get_auth_request()
+        saml_request_id = (
+            self.env["auth_saml.request"]
+            .search([("saml_provider_id", "=", self.saml_provider.id)])
+            .saml_request_id
+        )
+        saml_response = self.idp.fake_login(redirect_url)._unpack().get("SAMLResponse")
+        self.env["res.users"].sudo().auth_saml(
+            self.saml_provider.id, saml_response, None
+        )
+        self.assertEqual(self.env["auth_saml.assertion"].search_count([]), 1)
+
+        # the assertion is rejected from the memory of the worker
+        self.saml_provider._store_outstanding_request(saml_request_id)
+        with self.assertRaises(ValidationError):
+            self.env["res.users"].sudo().auth_saml(
+                self.saml_provider.id, saml_response, None
+            )
+        # and by the other workers
+        self.saml_provider._store_outstanding_request(saml_request_id)
+        with patch.dict(assertion_cache._caches, clear=True), self.assertRaises(
+            ValidationError
+        ):
+            self.env["res.users"].sudo().auth_saml(
+                self.saml_provider.id, saml_response, None
+            )
+
+    def test_metadata_conditional_requests(self):
+        url = "/auth_saml/metadata?p=%d&d=%s" % (
+            self.saml_provider.id,
+            self.env.cr.dbname,
+        )
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        self.assertTrue(etag)
+        self.assertTrue(last_modified)
+
+        response = self.url_open(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+        response = self.url_open(url, headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 304)
+        response = self.url_open(url, headers={"If-None-Match": '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_metadata_valid(self):
+        url = "/auth_saml/metadata?p=%d&d=%s" % (
+            self.saml_provider.id,
+            self.env.cr.dbname,
+        )
+        for valid in ("abc", "0", "-1", "1e9", str(24 * 365 + 1)):
+            response = self.url_open(url + "&valid=" + valid)
+            self.assertEqual(response.status_code, 400, valid)
+
+        period = datetime(2024, 1, 1, 10)
+        with patch.object(
+            type(self.saml_provider), "_get_metadata_period", return_value=period
+        ):
+            response = self.url_open(url + "&valid=24")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"validUntil", response.content)
+            etag = response.headers["ETag"]
+            response = self.url_open(url + "&valid=24", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+        # the metadata are generated again in the next period
+        with patch.object(
+            type(self.saml_provider),
+            "_get_metadata_period",
+            return_value=period + timedelta(hours=1),
+        ):
+            response = self.url_open(url + "&valid=24", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_metadata_period(self):
+        self.assertIsNone(self.saml_provider._get_metadata_period(None))
+        period = self.saml_provider._get_metadata_period(24)
+        self.assertLessEqual(period, datetime.utcnow())
+        self.assertEqual(period.minute, 0)
+        self.assertEqual(period.second, 0)
+        # short validities are generated again more often
+        period = self.saml_provider._get_metadata_period(1)
+        self.assertEqual(period.minute % 6, 0)
+        self.assertEqual(period.second, 0)
+
+    def test_metadata_cache(self):
+        metadata = self.saml_provider._get_cached_metadata(None, "http://localhost")
+        with patch.object(
+            type(self.saml_provider), "_metadata_string"
+        ) as metadata_string:
+            self.assertEqual(
+                self.saml_provider._get_cached_metadata(None, "http://localhost"),
+                metadata,
+            )
+            metadata_string.assert_not_called()
+        self.saml_provider.write({"entity_id": "other_entity"})
+        self.assertIn(
+            "other_entity",
+            str(self.saml_provider._get_cached_metadata(None, "http://localhost")),
+        )
+        # metadata with a validity are kept until the end of the period
+        metadata = self.saml_provider._get_cached_metadata(24, "http://localhost")
+        period = self.saml_provider._get_metadata_period(24)
+        with patch.object(
+            type(self.saml_provider),
+            "_get_metadata_period",
+            return_value=period + timedelta(hours=1),
+        ):
+            self.assertNotEqual(
+                self.saml_provider._get_cached_metadata(24, "http://localhost"),
+                metadata,
+            )